@@ -2,7 +2,14 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 from config import Config
-from database import get_db
+import database
+from database import get_db, pool, replicas, read_only
+import dal
+from query_trace import tracer
+import queries
+from metrics import Metrics, stats_collector
+from compression import Compressor
+from auth_middleware import token_required, token_cache, decode_token
 import jwt
 import os
 from datetime import datetime, timedelta
@@ -12,12 +19,38 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 app.config.from_object(Config)
+metrics = Metrics('auth-service')
+metrics.init_app(app)
+compressor = Compressor.from_config(Config)
+compressor.init_app(app)
+database.init_app(app)
+tracer.init_app(app)
+metrics.register_collector(stats_collector('token_cache', token_cache.stats))
+metrics.register_collector(stats_collector('compression', compressor.route_stats, label='route'))
+metrics.register_collector(stats_collector('db_pool', pool.stats))
+metrics.register_collector(stats_collector('db_replica', replicas.replica_stats, label='replica'))
+metrics.register_collector(stats_collector('db_reads', replicas.routing_stats))
+metrics.register_collector(stats_collector('query', dal.query_stats.stats, label='query'))
+metrics.register_collector(stats_collector('query_trace', tracer.route_stats, label='route'))
 
 # Health check
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'service': 'auth-service'}), 200
 
+# Runtime stats
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'token_cache': token_cache.stats(),
+        'compression': compressor.stats(),
+        'db_pool': pool.stats(),
+        'db_replicas': replicas.replica_stats(),
+        'db_reads': replicas.routing_stats(),
+        'queries': dal.query_stats.stats(),
+        'query_trace': tracer.stats()
+    }), 200
+
 # Register user
 @app.route('/auth/register', methods=['POST'])
 def register():
@@ -102,7 +135,7 @@ def verify_token():
         return jsonify({'error': 'No token provided'}), 400
     
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        payload = decode_token(token)
         return jsonify({'valid': True, 'user_id': payload['user_id'], 'role': payload['role']}), 200
     except jwt.ExpiredSignatureError:
         return jsonify({'error': 'Token expired'}), 401
@@ -111,31 +144,16 @@ def verify_token():
 
 # Get current user
 @app.route('/auth/me', methods=['GET'])
-def get_current_user():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+@read_only
+def get_current_user(payload):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        db = get_db()
-        cursor = db.cursor()
-        
-        cursor.execute('SELECT id, name, email, role FROM users WHERE id = %s', (payload['user_id'],))
-        user = cursor.fetchone()
+        user = dal.fetch_one(queries.USER_BY_ID, (payload['user_id'],))
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify({
-            'user_id': user[0],
-            'name': user[1],
-            'email': user[2],
-            'role': user[3]
-        }), 200
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
+        return jsonify(user), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
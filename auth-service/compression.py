@@ -0,0 +1,137 @@
+import gzip
+import threading
+import time
+import zlib
+from flask import request
+
+# Media types worth compressing; everything else is sent as is
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+# Preferred first when the client accepts both with equal weight
+ENCODINGS = ('gzip', 'deflate')
+
+
+def negotiate(accept_encoding):
+    """Pick gzip or deflate from an Accept-Encoding header, or None"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    best = None
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (encoding, q)
+    return best[0] if best else None
+
+
+def compress(body, encoding, level):
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    return zlib.compress(body, level)
+
+
+class Compressor:
+    """Accept-Encoding negotiated gzip/deflate for response bodies.
+
+    Bodies under `min_size` are sent uncompressed, as are streamed or
+    already encoded responses. Per-route stats record bytes before/after and
+    the CPU time spent, so the bandwidth saved can be weighed against it.
+    """
+
+    def __init__(self, min_size=1024, level=6, enabled=True):
+        self.min_size = min_size
+        self.level = level
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.COMPRESSION_MIN_SIZE, config.COMPRESSION_LEVEL, config.COMPRESSION_ENABLED)
+
+    def init_app(self, app):
+        app.after_request(self._compress_response)
+
+    def encode(self, body, encoding):
+        """Compress `body`, recording the cost against the current route"""
+        started = time.thread_time()
+        data = compress(body, encoding, self.level)
+        self.record(len(body), len(data), time.thread_time() - started)
+        return data
+
+    def record(self, bytes_in, bytes_out, cpu_seconds=0.0, precompressed=False):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'responses': 0, 'precompressed': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0
+                }
+            stats['responses'] += 1
+            stats['precompressed'] += int(precompressed)
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+            stats['cpu_seconds'] += cpu_seconds
+
+    def wants(self, response):
+        """Encoding to use for `response`, or None to send it as is"""
+        if not self.enabled or response.direct_passthrough or response.is_streamed:
+            return None
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return None
+        if 'Content-Encoding' in response.headers:
+            return None
+        if not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+            return None
+        # Varies whether or not this client gets it compressed
+        response.vary.add('Accept-Encoding')
+        if response.content_length is not None and response.content_length < self.min_size:
+            return None
+        return negotiate(request.headers.get('Accept-Encoding', ''))
+
+    def _compress_response(self, response):
+        encoding = self.wants(response)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+        return self.apply(response, self.encode(body, encoding), encoding)
+
+    def apply(self, response, data, encoding):
+        """Swap in an already compressed body"""
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        # The encoded bytes are a different representation of the same resource
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def route_stats(self):
+        with self._lock:
+            return {
+                route: dict(
+                    stats,
+                    cpu_seconds=round(stats['cpu_seconds'], 6),
+                    ratio=round(stats['bytes_out'] / stats['bytes_in'], 4) if stats['bytes_in'] else 0
+                )
+                for route, stats in self._routes.items()
+            }
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'min_size': self.min_size,
+            'level': self.level,
+            'routes': self.route_stats()
+        }
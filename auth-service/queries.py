@@ -0,0 +1,7 @@
+from dal import Query
+
+USER_BY_ID = Query(
+    'user_by_id',
+    'SELECT id, name, email, role FROM users WHERE id = %s',
+    ('user_id', 'name', 'email', 'role')
+)
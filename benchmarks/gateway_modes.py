@@ -0,0 +1,113 @@
+"""Compare the sync (Flask) and async (aiohttp) gateway serving modes.
+
+1. Start stub upstream services that answer every path after a fixed delay:
+       python benchmarks/gateway_modes.py stub --delay-ms 50
+2. Start both gateways against the stubs:
+       cd gateway && gunicorn app:app -w 1 --threads 32 -b :5000
+       cd gateway && PORT=5010 python async_app.py
+3. Drive the same load through both and print JSON results:
+       python benchmarks/gateway_modes.py run --sync http://localhost:5000 \\
+           --async http://localhost:5010 --path /api/courses --concurrency 500
+"""
+import argparse
+import asyncio
+import json
+import time
+from aiohttp import web, ClientSession, TCPConnector
+
+STUB_PORTS = (5001, 5002, 5003, 5004, 5005)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_stubs(delay_ms):
+    async def handler(request):
+        await asyncio.sleep(delay_ms / 1000)
+        return web.json_response({'path': request.path, 'stub': True})
+
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    for port in STUB_PORTS:
+        await web.TCPSite(runner, '0.0.0.0', port).start()
+    print(f'Stub services on ports {STUB_PORTS} with {delay_ms}ms delay')
+    await asyncio.Event().wait()
+
+
+async def drive(base_url, path, total, concurrency):
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    async with session.get(f'{base_url}{path}') as response:
+                        await response.read()
+                        if response.status >= 500:
+                            errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'url': f'{base_url}{path}',
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': errors,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2)
+    }
+
+
+async def compare(args):
+    results = {}
+    for mode, url in (('sync', args.sync_url), ('async', args.async_url)):
+        if url:
+            # Warm up pools before measuring
+            await drive(url, args.path, min(args.concurrency, args.requests), args.concurrency)
+            results[mode] = await drive(url, args.path, args.requests, args.concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    stub = sub.add_parser('stub', help='run stub upstream services')
+    stub.add_argument('--delay-ms', type=float, default=50)
+
+    run = sub.add_parser('run', help='benchmark one or both gateway modes')
+    run.add_argument('--sync', dest='sync_url')
+    run.add_argument('--async', dest='async_url')
+    run.add_argument('--path', default='/api/courses')
+    run.add_argument('--requests', type=int, default=5000)
+    run.add_argument('--concurrency', type=int, default=200)
+
+    args = parser.parse_args()
+    if args.command == 'stub':
+        asyncio.run(run_stubs(args.delay_ms))
+    else:
+        print(json.dumps(asyncio.run(compare(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Measure quiz submission throughput at different quiz sizes.
+
+Needs a seeded database and manifest (see seed.py) and the stack running.
+Creates one quiz per size on new lessons, then submits attempts with random
+answers through the gateway:
+
+    python benchmarks/quiz_submit.py --sizes 10,50,200 --submissions 2000 \\
+        --concurrency 50 --output results/submit-$(git rev-parse --short HEAD).json
+
+Connects to MySQL with the same DB_* environment variables as the services.
+All requests come from one address, so run the gateway with
+ADMISSION_ENABLED=false (or RATE_* limits well above the offered load).
+Logins wait out a 429's Retry-After; rate-limited submissions are counted
+under rate_limited and left out of the latency figures.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import mysql.connector
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from workload import summarize, git_commit
+
+
+def create_quiz(db, questions, choices, tag):
+    """Insert a quiz with `questions` questions on a new lesson; returns its answer sheet"""
+    cursor = db.cursor()
+    cursor.execute('SELECT m.id, MAX(l.order_index) FROM modules m LEFT JOIN lessons l ON l.module_id = m.id '
+                   'GROUP BY m.id ORDER BY m.id LIMIT 1')
+    row = cursor.fetchone()
+    if not row:
+        raise SystemExit('No modules found; run benchmarks/seed.py first')
+    cursor.execute(
+        'INSERT INTO lessons (module_id, title, order_index) VALUES (%s, %s, %s)',
+        (row[0], f'Submit benchmark {tag} ({questions} questions)', (row[1] or 0) + 1)
+    )
+    lesson_id = cursor.lastrowid
+    cursor.execute(
+        'INSERT INTO quizzes (lesson_id, title, passing_score) VALUES (%s, %s, %s)',
+        (lesson_id, f'Submit benchmark {questions}', 70)
+    )
+    quiz_id = cursor.lastrowid
+    cursor.executemany('INSERT INTO questions (quiz_id, prompt, type, order_index) VALUES (%s, %s, %s, %s)', [
+        (quiz_id, f'Question {q + 1}?', 'multiple_choice', q + 1) for q in range(questions)
+    ])
+    cursor.execute('SELECT id FROM questions WHERE quiz_id = %s ORDER BY order_index', (quiz_id,))
+    question_ids = [r[0] for r in cursor.fetchall()]
+    cursor.executemany('INSERT INTO choices (question_id, text, is_correct, order_index) VALUES (%s, %s, %s, %s)', [
+        (question_id, f'Choice {c + 1}', c == 0, c + 1) for question_id in question_ids for c in range(choices)
+    ])
+    cursor.execute(
+        'SELECT c.question_id, c.id FROM choices c JOIN questions qs ON c.question_id = qs.id '
+        'WHERE qs.quiz_id = %s ORDER BY qs.order_index, c.order_index',
+        (quiz_id,)
+    )
+    sheet = {}
+    for question_id, choice_id in cursor.fetchall():
+        sheet.setdefault(question_id, []).append(choice_id)
+    db.commit()
+    cursor.close()
+    return {'quiz_id': quiz_id, 'lesson_id': lesson_id, 'questions': sheet}
+
+
+async def login(session, base_url, email, password, attempts=30):
+    """Log in, waiting out the gateway's auth rate limit (1/s by default) when it answers 429"""
+    for _ in range(attempts):
+        async with session.post(f'{base_url}/api/auth/login', json={'email': email, 'password': password}) as response:
+            body = await response.json()
+            if response.status == 429:
+                try:
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                except ValueError:
+                    retry_after = 1
+                await asyncio.sleep(retry_after)
+                continue
+            if response.status != 200:
+                raise SystemExit(f'Login failed for {email}: {body}')
+            return body['token']
+    raise SystemExit(f'Login for {email} still rate limited after {attempts} tries; set ADMISSION_ENABLED=false')
+
+
+async def drive(session, base_url, quiz, tokens, total, concurrency, rng):
+    latencies = []
+    statuses = {}
+    errors = 0
+    rate_limited = 0
+    remaining = total
+    path = f"{base_url}/api/quizzes/{quiz['quiz_id']}/attempts"
+
+    async def worker():
+        nonlocal remaining, errors, rate_limited
+        while remaining > 0:
+            remaining -= 1
+            answers = [
+                {'question_id': question_id, 'choice_id': rng.choice(choices)}
+                for question_id, choices in quiz['questions'].items()
+            ]
+            headers = {'Authorization': f'Bearer {rng.choice(tokens)}'}
+            started = time.perf_counter()
+            try:
+                async with session.post(path, json={'answers': answers}, headers=headers) as response:
+                    await response.read()
+                    status = response.status
+            except Exception:
+                status = 'error'
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 429:
+                rate_limited += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status == 'error' or status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started, statuses, rate_limited)
+
+
+async def run(args, quizzes, manifest):
+    rng = random.Random(args.seed)
+    timeout = ClientTimeout(total=args.timeout)
+    base_url = args.gateway.rstrip('/')
+    async with ClientSession(connector=TCPConnector(limit=args.concurrency), timeout=timeout) as session:
+        emails = rng.sample(manifest['users'], min(args.users, len(manifest['users'])))
+        tokens = [await login(session, base_url, email, manifest['password']) for email in emails]
+        results = {}
+        for size, quiz in quizzes.items():
+            # Warm the service's quiz cache and connection pools first
+            await drive(session, base_url, quiz, tokens, args.concurrency, args.concurrency, rng)
+            results[str(size)] = dict(
+                await drive(session, base_url, quiz, tokens, args.submissions, args.concurrency, rng),
+                quiz_id=quiz['quiz_id']
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gateway', default='http://localhost:5000')
+    parser.add_argument('--manifest', default=os.path.join(os.path.dirname(__file__), 'dataset.json'))
+    parser.add_argument('--sizes', default='10,50,200', help='questions per quiz, comma separated')
+    parser.add_argument('--choices', type=int, default=4, help='choices per question')
+    parser.add_argument('--submissions', type=int, default=1000, help='measured submissions per size')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--users', type=int, default=100, help='seeded students to log in as')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON results here')
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    tag = int(time.time())
+    db = mysql.connector.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=int(os.getenv('DB_PORT', 3306)),
+        user=os.getenv('DB_USER', 'root'),
+        password=os.getenv('DB_PASSWORD', 'password'),
+        database=os.getenv('DB_NAME', 'learning_tracker')
+    )
+    try:
+        quizzes = {size: create_quiz(db, size, args.choices, tag) for size in sizes}
+    finally:
+        db.close()
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'gateway': args.gateway,
+            'concurrency': args.concurrency,
+            'submissions': args.submissions,
+            'choices': args.choices
+        },
+        'sizes': asyncio.run(run(args, quizzes, manifest))
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
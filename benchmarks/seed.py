@@ -0,0 +1,256 @@
+"""Seed the learning_tracker schema with a synthetic, reproducible dataset.
+
+Connects with the same DB_* environment variables as the services and
+writes a manifest (user logins, lesson and quiz ids) for workload.py:
+
+    python benchmarks/seed.py --reset --users 2000 --courses 50 \\
+        --manifest benchmarks/dataset.json
+
+With --reset, the same --seed and sizes produce the same rows (timestamps
+are relative to now). Without it the rows are added next to whatever is
+already in the database.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+import mysql.connector
+
+PASSWORD = 'bench-password'
+TABLES = (
+    'quiz_user_summary', 'quiz_choice_stats', 'quiz_item_stats', 'quiz_analysis_state',
+    'attempt_answers', 'quiz_attempts', 'choices', 'questions', 'quizzes', 'reports',
+    'enrollments', 'progress_idempotency_keys', 'progress', 'lessons', 'modules', 'courses', 'users'
+)
+CHUNK = 1000
+
+
+def insert_many(cursor, sql, rows):
+    for i in range(0, len(rows), CHUNK):
+        cursor.executemany(sql, rows[i:i + CHUNK])
+
+
+def children(cursor, table, parent_column, parent_ids, columns='id'):
+    """Rows of `table` under the given parents, in parent then id order"""
+    rows = []
+    for i in range(0, len(parent_ids), CHUNK):
+        chunk = parent_ids[i:i + CHUNK]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        cursor.execute(
+            f'SELECT {parent_column}, {columns} FROM {table} WHERE {parent_column} IN ({placeholders}) '
+            f'ORDER BY {parent_column}, id',
+            chunk
+        )
+        rows.extend(cursor.fetchall())
+    return rows
+
+
+def text(rng, words):
+    vocabulary = ('learn', 'module', 'practice', 'concept', 'review', 'example', 'quiz', 'lesson',
+                  'skill', 'project', 'theory', 'exercise', 'chapter', 'topic', 'summary', 'guide')
+    return ' '.join(rng.choice(vocabulary) for _ in range(words))
+
+
+def seed(db, args):
+    rng = random.Random(args.seed)
+    cursor = db.cursor()
+    password_hash = hashlib.sha256(PASSWORD.encode()).hexdigest()
+    now = datetime.now().replace(microsecond=0)
+    timings = {}
+
+    def step(name):
+        db.commit()
+        timings[name] = round(time.perf_counter() - step.started, 3)
+        step.started = time.perf_counter()
+    step.started = time.perf_counter()
+
+    if args.reset:
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 0')
+        for table in TABLES:
+            cursor.execute(f'TRUNCATE TABLE {table}')
+        cursor.execute('SET FOREIGN_KEY_CHECKS = 1')
+        step('reset')
+
+    # Users: a few instructors, the rest students
+    tag = f'{args.seed}-{int(time.time())}' if not args.reset else str(args.seed)
+    users = [
+        (f'Bench {role} {i}', f'bench-{tag}-{role}-{i}@example.com', password_hash, role)
+        for role, count in (('instructor', args.instructors), ('student', args.users))
+        for i in range(count)
+    ]
+    insert_many(cursor, 'INSERT INTO users (name, email, password_hash, role) VALUES (%s, %s, %s, %s)', users)
+    cursor.execute('SELECT id, email, role FROM users WHERE email LIKE %s ORDER BY id', (f'bench-{tag}-%',))
+    user_rows = cursor.fetchall()
+    instructors = [r[0] for r in user_rows if r[2] == 'instructor']
+    students = [(r[0], r[1]) for r in user_rows if r[2] == 'student']
+    step('users')
+
+    # Catalog: courses -> modules -> lessons
+    courses = [
+        (f'Bench course {tag}-{i}', text(rng, args.description_words), rng.choice(('beginner', 'intermediate', 'advanced')),
+         rng.choice(instructors))
+        for i in range(args.courses)
+    ]
+    insert_many(cursor, 'INSERT INTO courses (title, description, level, instructor_id) VALUES (%s, %s, %s, %s)', courses)
+    cursor.execute('SELECT id FROM courses WHERE title LIKE %s ORDER BY id', (f'Bench course {tag}-%',))
+    course_ids = [r[0] for r in cursor.fetchall()]
+
+    insert_many(cursor, 'INSERT INTO modules (course_id, title, order_index) VALUES (%s, %s, %s)', [
+        (course_id, f'Module {m + 1}', m + 1) for course_id in course_ids for m in range(args.modules)
+    ])
+    modules = children(cursor, 'modules', 'course_id', course_ids)
+    module_course = {module_id: course_id for course_id, module_id in modules}
+
+    insert_many(cursor, '''INSERT INTO lessons (module_id, title, content_url, description, order_index, duration_minutes)
+                           VALUES (%s, %s, %s, %s, %s, %s)''', [
+        (module_id, f'Lesson {n + 1}', f'https://example.com/lessons/{module_id}/{n + 1}',
+         text(rng, args.description_words // 2), n + 1, rng.randint(5, 45))
+        for module_id in module_course for n in range(args.lessons)
+    ])
+    lessons = children(cursor, 'lessons', 'module_id', list(module_course))
+    lesson_course = {lesson_id: module_course[module_id] for module_id, lesson_id in lessons}
+    lesson_ids = list(lesson_course)
+    step('catalog')
+
+    # Quizzes on a share of lessons, each question with one correct choice
+    quiz_lessons = [lesson_id for lesson_id in lesson_ids if rng.random() < args.quiz_ratio]
+    insert_many(cursor, 'INSERT INTO quizzes (lesson_id, title, passing_score, max_attempts) VALUES (%s, %s, %s, %s)', [
+        (lesson_id, f'Quiz for lesson {lesson_id}', 70, None) for lesson_id in quiz_lessons
+    ])
+    quizzes = children(cursor, 'quizzes', 'lesson_id', quiz_lessons)
+    quiz_ids = [quiz_id for _, quiz_id in quizzes]
+
+    insert_many(cursor, 'INSERT INTO questions (quiz_id, prompt, type, order_index) VALUES (%s, %s, %s, %s)', [
+        (quiz_id, text(rng, 12) + '?', 'multiple_choice', q + 1) for quiz_id in quiz_ids for q in range(args.questions)
+    ])
+    questions = children(cursor, 'questions', 'quiz_id', quiz_ids)
+    correct = {question_id: rng.randrange(args.choices) for _, question_id in questions}
+
+    insert_many(cursor, 'INSERT INTO choices (question_id, text, is_correct, order_index) VALUES (%s, %s, %s, %s)', [
+        (question_id, text(rng, 4), c == correct[question_id], c + 1)
+        for question_id in correct for c in range(args.choices)
+    ])
+    choice_rows = children(cursor, 'choices', 'question_id', list(correct), 'id, order_index')
+    step('quizzes')
+
+    quiz_questions = {}
+    for quiz_id, question_id in questions:
+        quiz_questions.setdefault(quiz_id, []).append(question_id)
+    question_choices = {}
+    for question_id, choice_id, order_index in choice_rows:
+        question_choices.setdefault(question_id, []).append((choice_id, order_index - 1 == correct[question_id]))
+
+    # Per-student history: progress rows, enrollments and past quiz attempts
+    progress, enrollments = [], set()
+    for user_id, _ in students:
+        for lesson_id in rng.sample(lesson_ids, min(args.progress, len(lesson_ids))):
+            started = now - timedelta(days=rng.randint(0, 30), minutes=rng.randint(0, 1440))
+            completed = started + timedelta(minutes=rng.randint(5, 90)) if rng.random() < 0.6 else None
+            progress.append((user_id, lesson_id, 'completed' if completed else 'in_progress', started, completed))
+            enrollments.add((user_id, lesson_course[lesson_id]))
+    insert_many(cursor, '''INSERT INTO progress (user_id, lesson_id, status, started_at, completed_at)
+                           VALUES (%s, %s, %s, %s, %s)''', progress)
+    insert_many(cursor, 'INSERT INTO enrollments (user_id, course_id) VALUES (%s, %s)', sorted(enrollments))
+    step('progress')
+
+    attempts, attempt_answers = [], []
+    for user_id, _ in students:
+        for _ in range(args.attempts if quiz_ids else 0):
+            quiz_id = rng.choice(quiz_ids)
+            answers = [(question_id, rng.choice(question_choices[question_id])) for question_id in quiz_questions[quiz_id]]
+            right = sum(1 for _, (_, is_correct) in answers if is_correct)
+            finished = now - timedelta(days=rng.randint(0, 30), minutes=rng.randint(0, 1440))
+            attempts.append((quiz_id, user_id, round(right / len(answers) * 100, 2), len(answers), right,
+                             finished - timedelta(minutes=10), finished))
+            attempt_answers.append(answers)
+    cursor.execute('SELECT COALESCE(MAX(id), 0) FROM quiz_attempts')
+    last_id = cursor.fetchone()[0]
+    insert_many(cursor, '''INSERT INTO quiz_attempts
+                           (quiz_id, user_id, score, total_questions, correct_answers, started_at, finished_at)
+                           VALUES (%s, %s, %s, %s, %s, %s, %s)''', attempts)
+    # Ids come back in insertion order; the seeder is the only writer
+    cursor.execute('SELECT id FROM quiz_attempts WHERE id > %s ORDER BY id', (last_id,))
+    attempt_ids = [r[0] for r in cursor.fetchall()]
+    insert_many(cursor, 'INSERT INTO attempt_answers (attempt_id, question_id, choice_id, is_correct) VALUES (%s, %s, %s, %s)', [
+        (attempt_id, question_id, choice_id, is_correct)
+        for attempt_id, answers in zip(attempt_ids, attempt_answers)
+        for question_id, (choice_id, is_correct) in answers
+    ])
+    # Keep the per-user summary in step, as the quiz service would have
+    cursor.execute('''INSERT INTO quiz_user_summary (user_id, quiz_id, attempts, best_score, last_score, last_attempt_at)
+                      SELECT user_id, quiz_id, COUNT(*), MAX(score),
+                             SUBSTRING_INDEX(GROUP_CONCAT(score ORDER BY finished_at DESC, id DESC), ',', 1),
+                             MAX(finished_at)
+                      FROM quiz_attempts WHERE id > %s GROUP BY user_id, quiz_id
+                      ON DUPLICATE KEY UPDATE
+                      attempts = attempts + VALUES(attempts),
+                      best_score = GREATEST(COALESCE(best_score, 0), VALUES(best_score)),
+                      last_score = IF(VALUES(last_attempt_at) >= last_attempt_at, VALUES(last_score), last_score),
+                      last_attempt_at = GREATEST(last_attempt_at, VALUES(last_attempt_at))''', (last_id,))
+    step('attempts')
+    cursor.close()
+
+    return {
+        'seed': args.seed,
+        'password': PASSWORD,
+        'users': [email for _, email in students],
+        'courses': course_ids,
+        'lessons': lesson_ids,
+        'quizzes': [
+            {'quiz_id': quiz_id, 'lesson_id': lesson_id, 'questions': [
+                {'question_id': question_id, 'choices': [choice_id for choice_id, _ in question_choices[question_id]]}
+                for question_id in quiz_questions.get(quiz_id, [])
+            ]}
+            for lesson_id, quiz_id in quizzes
+        ],
+        'counts': {
+            'users': len(students), 'instructors': len(instructors), 'courses': len(course_ids),
+            'modules': len(module_course), 'lessons': len(lesson_ids), 'quizzes': len(quiz_ids),
+            'questions': len(questions), 'choices': len(choice_rows), 'progress': len(progress),
+            'enrollments': len(enrollments), 'attempts': len(attempts),
+            'attempt_answers': sum(len(a) for a in attempt_answers)
+        },
+        'seconds': timings
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='truncate every table first')
+    parser.add_argument('--users', type=int, default=1000, help='students')
+    parser.add_argument('--instructors', type=int, default=20)
+    parser.add_argument('--courses', type=int, default=30)
+    parser.add_argument('--modules', type=int, default=5, help='modules per course')
+    parser.add_argument('--lessons', type=int, default=6, help='lessons per module')
+    parser.add_argument('--quiz-ratio', type=float, default=0.5, help='share of lessons with a quiz')
+    parser.add_argument('--questions', type=int, default=10, help='questions per quiz')
+    parser.add_argument('--choices', type=int, default=4, help='choices per question')
+    parser.add_argument('--progress', type=int, default=20, help='progress rows per student')
+    parser.add_argument('--attempts', type=int, default=5, help='quiz attempts per student')
+    parser.add_argument('--description-words', type=int, default=120, help='words in each course description')
+    parser.add_argument('--manifest', default=os.path.join(os.path.dirname(__file__), 'dataset.json'))
+    args = parser.parse_args()
+
+    db = mysql.connector.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=int(os.getenv('DB_PORT', 3306)),
+        user=os.getenv('DB_USER', 'root'),
+        password=os.getenv('DB_PASSWORD', 'password'),
+        database=os.getenv('DB_NAME', 'learning_tracker')
+    )
+    try:
+        manifest = seed(db, args)
+    finally:
+        db.close()
+
+    with open(args.manifest, 'w') as f:
+        json.dump(manifest, f)
+    print(json.dumps({'manifest': args.manifest, 'counts': manifest['counts'], 'seconds': manifest['seconds']}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
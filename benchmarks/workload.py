@@ -0,0 +1,308 @@
+"""Drive a mixed user workload through the gateway and report per-endpoint latency.
+
+1. Seed a database and write the manifest (see seed.py):
+       python benchmarks/seed.py --reset --manifest benchmarks/dataset.json
+2. Start MySQL, the services and the gateway (e.g. docker-compose up).
+3. Run the workload and save the results for this commit:
+       python benchmarks/workload.py run --gateway http://localhost:5000 \\
+           --concurrency 50 --duration 60 --output results/$(git rev-parse --short HEAD).json
+4. Compare two runs:
+       python benchmarks/workload.py compare results/abc123.json results/def456.json
+
+Each virtual user logs in as a seeded student and then repeatedly picks an
+action by weight (--mix browse=40,quiz=15,...). Requests made during the
+--warmup period are not counted.
+
+All traffic comes from one address, so run the gateway with
+ADMISSION_ENABLED=false (or RATE_* limits well above the offered load).
+Otherwise the run measures the rate limiter: requests answered 429 are
+counted under rate_limited and left out of the latency figures.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from gateway_modes import percentile
+
+DEFAULT_MIX = {
+    'browse': 40,
+    'quiz': 15,
+    'start_lesson': 10,
+    'complete_lesson': 10,
+    'submit_quiz': 10,
+    'progress': 8,
+    'weekly_report': 5,
+    'login': 2
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.rate_limited = {}
+        self.statuses = {}
+        self.recording = False
+
+    def record(self, endpoint, status, ms):
+        if not self.recording:
+            return
+        self.statuses.setdefault(endpoint, {})
+        self.statuses[endpoint][str(status)] = self.statuses[endpoint].get(str(status), 0) + 1
+        if status == 429:
+            # Rejected by the gateway's admission control before reaching a service
+            self.rate_limited[endpoint] = self.rate_limited.get(endpoint, 0) + 1
+            return
+        self.latencies.setdefault(endpoint, []).append(ms)
+        if status == 'error' or status >= 500:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, duration):
+        endpoints = {
+            endpoint: summarize(self.latencies.get(endpoint, []), self.errors.get(endpoint, 0), duration,
+                                statuses, self.rate_limited.get(endpoint, 0))
+            for endpoint, statuses in sorted(self.statuses.items())
+        }
+        every = [ms for latencies in self.latencies.values() for ms in latencies]
+        return summarize(every, sum(self.errors.values()), duration,
+                         rate_limited=sum(self.rate_limited.values())), endpoints
+
+
+def summarize(latencies, errors, duration, statuses=None, rate_limited=0):
+    """Latency summary of served requests; `rate_limited` (429) ones are only counted"""
+    ordered = sorted(latencies)
+    result = {
+        'requests': len(ordered),
+        'rate_limited': rate_limited,
+        'errors': errors,
+        'error_rate': round(errors / len(ordered), 4) if ordered else 0,
+        'throughput_rps': round(len(ordered) / duration, 2) if duration else 0,
+        'mean_ms': round(sum(ordered) / len(ordered), 2) if ordered else 0,
+        'p50_ms': round(percentile(ordered, 50), 2),
+        'p95_ms': round(percentile(ordered, 95), 2),
+        'p99_ms': round(percentile(ordered, 99), 2),
+        'max_ms': round(ordered[-1], 2) if ordered else 0
+    }
+    if statuses is not None:
+        result['statuses'] = statuses
+    return result
+
+
+class VirtualUser:
+    def __init__(self, session, base_url, manifest, recorder, rng):
+        self.session = session
+        self.base_url = base_url
+        self.manifest = manifest
+        self.recorder = recorder
+        self.rng = rng
+        self.email = rng.choice(manifest['users'])
+        self.token = None
+        self.retry_after = 0
+
+    async def call(self, endpoint, method, path, body=None):
+        """Make one request, record it under `endpoint` and return (status, parsed body)"""
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        started = time.perf_counter()
+        try:
+            async with self.session.request(method, self.base_url + path, json=body, headers=headers) as response:
+                payload = await response.read()
+                status = response.status
+                retry_after = response.headers.get('Retry-After')
+        except Exception:
+            self.recorder.record(endpoint, 'error', (time.perf_counter() - started) * 1000)
+            return None, None
+        self.recorder.record(endpoint, status, (time.perf_counter() - started) * 1000)
+        if status == 429:
+            try:
+                self.retry_after = float(retry_after)
+            except (TypeError, ValueError):
+                self.retry_after = 1
+        if status == 401 and endpoint != 'POST /api/auth/login':
+            self.token = None
+        try:
+            return status, json.loads(payload) if payload else None
+        except ValueError:
+            return status, None
+
+    async def login(self):
+        status, body = await self.call('POST /api/auth/login', 'POST', '/api/auth/login',
+                                       {'email': self.email, 'password': self.manifest['password']})
+        self.token = body.get('token') if status == 200 and body else None
+
+    async def browse(self):
+        await self.call('GET /api/courses', 'GET', '/api/courses')
+        course_id = self.rng.choice(self.manifest['courses'])
+        await self.call('GET /api/courses/{id}', 'GET', f'/api/courses/{course_id}')
+        status, modules = await self.call('GET /api/courses/{id}/modules', 'GET', f'/api/courses/{course_id}/modules')
+        if status == 200 and modules:
+            module = self.rng.choice(modules)
+            await self.call('GET /api/modules/{id}/lessons', 'GET', f"/api/modules/{module['id']}/lessons")
+
+    async def quiz(self):
+        quiz = self.rng.choice(self.manifest['quizzes'])
+        await self.call('GET /api/quizzes/lesson/{id}', 'GET', f"/api/quizzes/lesson/{quiz['lesson_id']}")
+
+    async def start_lesson(self):
+        lesson_id = self.rng.choice(self.manifest['lessons'])
+        await self.call('POST /api/progress/lesson/{id}/start', 'POST', f'/api/progress/lesson/{lesson_id}/start')
+
+    async def complete_lesson(self):
+        lesson_id = self.rng.choice(self.manifest['lessons'])
+        await self.call('POST /api/progress/lesson/{id}/complete', 'POST', f'/api/progress/lesson/{lesson_id}/complete')
+
+    async def submit_quiz(self):
+        quiz = self.rng.choice(self.manifest['quizzes'])
+        answers = [
+            {'question_id': q['question_id'], 'choice_id': self.rng.choice(q['choices'])}
+            for q in quiz['questions']
+        ]
+        await self.call('POST /api/quizzes/{id}/attempts', 'POST', f"/api/quizzes/{quiz['quiz_id']}/attempts",
+                        {'answers': answers})
+
+    async def progress(self):
+        await self.call('GET /api/progress', 'GET', '/api/progress')
+
+    async def weekly_report(self):
+        await self.call('GET /api/reports/week', 'GET', '/api/reports/week')
+
+    async def run(self, mix, deadline, think_ms):
+        actions, weights = zip(*mix.items())
+        while time.monotonic() < deadline:
+            if self.token is None:
+                await self.login()
+                if self.token is None:
+                    # Wait out the auth rate limit rather than hammering it
+                    await asyncio.sleep(max(0.5, self.retry_after))
+                    self.retry_after = 0
+                    continue
+            action = self.rng.choices(actions, weights)[0]
+            if action == 'quiz' or action == 'submit_quiz':
+                if not self.manifest['quizzes']:
+                    continue
+            await getattr(self, action)()
+            if think_ms:
+                await asyncio.sleep(self.rng.uniform(0, 2 * think_ms) / 1000)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX)
+    if value:
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            if name.strip() not in DEFAULT_MIX:
+                raise SystemExit(f'Unknown action in --mix: {name}')
+            mix[name.strip()] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+async def run(args):
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    timeout = ClientTimeout(total=args.timeout)
+
+    async with ClientSession(connector=TCPConnector(limit=args.concurrency), timeout=timeout) as session:
+        users = [
+            VirtualUser(session, args.gateway.rstrip('/'), manifest, recorder, random.Random(rng.random()))
+            for _ in range(args.concurrency)
+        ]
+        started = time.monotonic()
+        deadline = started + args.warmup + args.duration
+        tasks = [asyncio.ensure_future(user.run(mix, deadline, args.think_ms)) for user in users]
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        measured_from = time.monotonic()
+        await asyncio.gather(*tasks)
+        duration = time.monotonic() - measured_from
+
+    overall, endpoints = recorder.summary(duration)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'gateway': args.gateway,
+            'concurrency': args.concurrency,
+            'duration_s': round(duration, 3),
+            'warmup_s': args.warmup,
+            'think_ms': args.think_ms,
+            'seed': args.seed,
+            'mix': mix,
+            'dataset': manifest.get('counts')
+        },
+        'overall': overall,
+        'endpoints': endpoints
+    }
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def change(a, b):
+        return f'{(b - a) / a * 100:+.1f}%' if a else 'n/a'
+
+    print(f"{'endpoint':45} {'rps':>18} {'p50 ms':>22} {'p95 ms':>22} {'p99 ms':>22}")
+    rows = [('overall', old['overall'], new['overall'])] + [
+        (endpoint, old['endpoints'].get(endpoint), stats) for endpoint, stats in new['endpoints'].items()
+    ]
+    for name, a, b in rows:
+        if not a:
+            continue
+        cells = [f"{a[k]:>8} {change(a[k], b[k]):>9}" for k in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')]
+        print(f'{name:45} ' + ' '.join(f'{c:>22}' for c in cells))
+    for label, run in (('old', old), ('new', new)):
+        if run['overall'].get('rate_limited'):
+            print(f"warning: {run['overall']['rate_limited']} requests in the {label} run were rate limited (429); "
+                  'run the gateway with ADMISSION_ENABLED=false')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='drive the workload and print/save JSON results')
+    run_parser.add_argument('--gateway', default='http://localhost:5000')
+    run_parser.add_argument('--manifest', default='benchmarks/dataset.json')
+    run_parser.add_argument('--concurrency', type=int, default=50, help='virtual users')
+    run_parser.add_argument('--duration', type=float, default=60, help='measured seconds')
+    run_parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds first')
+    run_parser.add_argument('--think-ms', type=float, default=0, help='mean pause between actions')
+    run_parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    run_parser.add_argument('--mix', help='action weights, e.g. browse=60,submit_quiz=5')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--output', help='also write the JSON results here')
+
+    compare_parser = sub.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        compare(args.old, args.new)
+        return
+
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
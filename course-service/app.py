@@ -2,86 +2,97 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 from config import Config
-from database import get_db
-import jwt
+import database
+from database import get_db, pool, replicas, read_only
+import dal
+from query_trace import tracer
+import queries
+from metrics import Metrics, stats_collector
+from compression import Compressor
+from auth_middleware import token_required, token_cache
+from conditional import make_etag, last_modified, not_modified, with_validators
 
 load_dotenv()
 app = Flask(__name__)
 CORS(app)
 app.config.from_object(Config)
+metrics = Metrics('course-service')
+metrics.init_app(app)
+compressor = Compressor.from_config(Config)
+compressor.init_app(app)
+database.init_app(app)
+tracer.init_app(app)
+metrics.register_collector(stats_collector('token_cache', token_cache.stats))
+metrics.register_collector(stats_collector('compression', compressor.route_stats, label='route'))
+metrics.register_collector(stats_collector('db_pool', pool.stats))
+metrics.register_collector(stats_collector('db_replica', replicas.replica_stats, label='replica'))
+metrics.register_collector(stats_collector('db_reads', replicas.routing_stats))
+metrics.register_collector(stats_collector('query', dal.query_stats.stats, label='query'))
+metrics.register_collector(stats_collector('query_trace', tracer.route_stats, label='route'))
 
 # Health check
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'service': 'course-service'}), 200
 
+# Runtime stats
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'token_cache': token_cache.stats(),
+        'compression': compressor.stats(),
+        'db_pool': pool.stats(),
+        'db_replicas': replicas.replica_stats(),
+        'db_reads': replicas.routing_stats(),
+        'queries': dal.query_stats.stats(),
+        'query_trace': tracer.stats()
+    }), 200
+
 # Get all courses
 @app.route('/courses', methods=['GET'])
+@read_only
 def get_courses():
     try:
-        db = get_db()
-        cursor = db.cursor()
+        # Version check first, so a matching If-None-Match skips the full read
+        count, updated_at = dal.fetch_rows(queries.COURSES_VERSION)[0]
+        etag = make_etag('courses', count, updated_at)
+        modified = last_modified(updated_at)
+        unchanged = not_modified(etag, modified)
+        if unchanged:
+            return unchanged
         
-        cursor.execute(
-            'SELECT id, title, description, level, instructor_id, created_at FROM courses'
-        )
-        courses = cursor.fetchall()
-        cursor.close()
-        
-        result = [
-            {
-                'id': c[0],
-                'title': c[1],
-                'description': c[2],
-                'level': c[3],
-                'instructor_id': c[4],
-                'created_at': str(c[5])
-            } for c in courses
-        ]
-        
-        return jsonify(result), 200
+        result = dal.fetch_all(queries.COURSE_LIST)
+        
+        return with_validators(jsonify(result), etag, modified), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Get course by ID
 @app.route('/courses/<int:course_id>', methods=['GET'])
+@read_only
 def get_course(course_id):
     try:
-        db = get_db()
-        cursor = db.cursor()
-        
-        cursor.execute(
-            'SELECT id, title, description, level, instructor_id, created_at FROM courses WHERE id = %s',
-            (course_id,)
-        )
-        course = cursor.fetchone()
-        cursor.close()
+        course = dal.fetch_one(queries.COURSE_BY_ID, (course_id,))
         
         if not course:
             return jsonify({'error': 'Course not found'}), 404
         
-        return jsonify({
-            'id': course[0],
-            'title': course[1],
-            'description': course[2],
-            'level': course[3],
-            'instructor_id': course[4],
-            'created_at': str(course[5])
-        }), 200
+        updated_at = course.pop('updated_at')
+        etag = make_etag('course', course_id, updated_at)
+        modified = last_modified(updated_at)
+        unchanged = not_modified(etag, modified)
+        if unchanged:
+            return unchanged
+        
+        return with_validators(jsonify(course), etag, modified), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Create course (requires auth)
 @app.route('/courses', methods=['POST'])
-def create_course():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+def create_course(payload):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        
         if payload['role'] not in ['admin', 'instructor']:
             return jsonify({'error': 'Unauthorized'}), 403
         
@@ -91,88 +102,57 @@ def create_course():
             return jsonify({'error': 'Missing required fields'}), 400
         
         db = get_db()
-        cursor = db.cursor()
-        
-        cursor.execute(
-            'INSERT INTO courses (title, description, level, instructor_id) VALUES (%s, %s, %s, %s)',
+        _, course_id = dal.execute(
+            queries.INSERT_COURSE,
             (data['title'], data.get('description'), data.get('level', 'beginner'), payload['user_id'])
         )
         db.commit()
-        course_id = cursor.lastrowid
-        cursor.close()
         
         return jsonify({'message': 'Course created', 'course_id': course_id}), 201
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Get modules for course
 @app.route('/courses/<int:course_id>/modules', methods=['GET'])
+@read_only
 def get_modules(course_id):
     try:
-        db = get_db()
-        cursor = db.cursor()
+        count, updated_at = dal.fetch_rows(queries.MODULES_VERSION, (course_id,))[0]
+        etag = make_etag('modules', course_id, count, updated_at)
+        modified = last_modified(updated_at)
+        unchanged = not_modified(etag, modified)
+        if unchanged:
+            return unchanged
         
-        cursor.execute(
-            'SELECT id, title, order_index FROM modules WHERE course_id = %s ORDER BY order_index',
-            (course_id,)
-        )
-        modules = cursor.fetchall()
-        cursor.close()
-        
-        result = [
-            {
-                'id': m[0],
-                'title': m[1],
-                'order_index': m[2]
-            } for m in modules
-        ]
-        
-        return jsonify(result), 200
+        result = dal.fetch_all(queries.MODULES_BY_COURSE, (course_id,))
+        
+        return with_validators(jsonify(result), etag, modified), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Get lessons for module
 @app.route('/modules/<int:module_id>/lessons', methods=['GET'])
+@read_only
 def get_lessons(module_id):
     try:
-        db = get_db()
-        cursor = db.cursor()
+        count, updated_at = dal.fetch_rows(queries.LESSONS_VERSION, (module_id,))[0]
+        etag = make_etag('lessons', module_id, count, updated_at)
+        modified = last_modified(updated_at)
+        unchanged = not_modified(etag, modified)
+        if unchanged:
+            return unchanged
         
-        cursor.execute(
-            'SELECT id, title, content_url, description, order_index, duration_minutes FROM lessons WHERE module_id = %s ORDER BY order_index',
-            (module_id,)
-        )
-        lessons = cursor.fetchall()
-        cursor.close()
-        
-        result = [
-            {
-                'id': l[0],
-                'title': l[1],
-                'content_url': l[2],
-                'description': l[3],
-                'order_index': l[4],
-                'duration_minutes': l[5]
-            } for l in lessons
-        ]
-        
-        return jsonify(result), 200
+        result = dal.fetch_all(queries.LESSONS_BY_MODULE, (module_id,))
+        
+        return with_validators(jsonify(result), etag, modified), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Create module (requires auth)
 @app.route('/modules', methods=['POST'])
-def create_module():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+def create_module(payload):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        
         if payload['role'] not in ['admin', 'instructor']:
             return jsonify({'error': 'Unauthorized'}), 403
         
@@ -182,19 +162,13 @@ def create_module():
             return jsonify({'error': 'Missing required fields'}), 400
         
         db = get_db()
-        cursor = db.cursor()
-        
-        cursor.execute(
-            'INSERT INTO modules (course_id, title, order_index) VALUES (%s, %s, %s)',
+        _, module_id = dal.execute(
+            queries.INSERT_MODULE,
             (data['course_id'], data['title'], data.get('order_index', 1))
         )
         db.commit()
-        module_id = cursor.lastrowid
-        cursor.close()
         
         return jsonify({'message': 'Module created', 'module_id': module_id}), 201
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,41 @@
+import hashlib
+from datetime import timezone
+from flask import request, Response
+
+
+def make_etag(*parts):
+    """Strong ETag from the values a response is built from (ids, row counts, max updated_at)"""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def last_modified(*timestamps):
+    """Latest of the given row timestamps as an aware UTC datetime.
+
+    MySQL returns TIMESTAMP values as naive datetimes in the session time
+    zone, which is taken to be UTC (the server default in the MySQL image).
+    With another session time zone Last-Modified is shifted by its offset;
+    ETags, and so If-None-Match, are unaffected.
+    """
+    stamps = [t for t in timestamps if t is not None]
+    if not stamps:
+        return None
+    return max(stamps).replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def not_modified(etag, modified=None):
+    """Return a 304 response if the client's copy is current, else None"""
+    if request.if_none_match:
+        if not request.if_none_match.contains_weak(etag):
+            return None
+    elif not (modified and request.if_modified_since and modified <= request.if_modified_since):
+        return None
+    return with_validators(Response(status=304), etag, modified)
+
+
+def with_validators(response, etag, modified=None):
+    response.set_etag(etag)
+    if modified:
+        response.last_modified = modified
+    # Clients may keep the body but must revalidate before reusing it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
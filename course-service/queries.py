@@ -0,0 +1,44 @@
+from dal import Query, to_str
+
+# Catalog versions, checked before the full reads for conditional GETs
+COURSES_VERSION = Query('courses_version', 'SELECT COUNT(*), MAX(updated_at) FROM courses')
+MODULES_VERSION = Query(
+    'modules_version',
+    'SELECT COUNT(*), MAX(updated_at) FROM modules WHERE course_id = %s'
+)
+LESSONS_VERSION = Query(
+    'lessons_version',
+    'SELECT COUNT(*), MAX(updated_at) FROM lessons WHERE module_id = %s'
+)
+
+COURSE_COLUMNS = ('id', 'title', 'description', 'level', 'instructor_id', ('created_at', to_str))
+
+COURSE_LIST = Query(
+    'course_list',
+    'SELECT id, title, description, level, instructor_id, created_at FROM courses',
+    COURSE_COLUMNS
+)
+COURSE_BY_ID = Query(
+    'course_by_id',
+    'SELECT id, title, description, level, instructor_id, created_at, updated_at FROM courses WHERE id = %s',
+    COURSE_COLUMNS + ('updated_at',)
+)
+MODULES_BY_COURSE = Query(
+    'modules_by_course',
+    'SELECT id, title, order_index FROM modules WHERE course_id = %s ORDER BY order_index',
+    ('id', 'title', 'order_index')
+)
+LESSONS_BY_MODULE = Query(
+    'lessons_by_module',
+    'SELECT id, title, content_url, description, order_index, duration_minutes FROM lessons WHERE module_id = %s ORDER BY order_index',
+    ('id', 'title', 'content_url', 'description', 'order_index', 'duration_minutes')
+)
+
+INSERT_COURSE = Query(
+    'insert_course',
+    'INSERT INTO courses (title, description, level, instructor_id) VALUES (%s, %s, %s, %s)'
+)
+INSERT_MODULE = Query(
+    'insert_module',
+    'INSERT INTO modules (course_id, title, order_index) VALUES (%s, %s, %s)'
+)
@@ -0,0 +1,200 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Priority classes: writes outrank ordinary reads, which outrank report reads
+HIGH = 'high'
+NORMAL = 'normal'
+LOW = 'low'
+
+# Gateway endpoint -> (upstream service, rate class, priority)
+ROUTE_POLICY = {
+    'register': ('auth', 'auth', NORMAL),
+    'login': ('auth', 'auth', NORMAL),
+    'verify_token': ('auth', 'read', NORMAL),
+    'get_me': ('auth', 'read', NORMAL),
+    'get_courses': ('course', 'read', NORMAL),
+    'get_course': ('course', 'read', NORMAL),
+    'create_course': ('course', 'write', HIGH),
+    'get_modules': ('course', 'read', NORMAL),
+    'get_lessons': ('course', 'read', NORMAL),
+    'get_course_tree': ('course', 'read', NORMAL),
+    'get_quiz': ('quiz', 'read', NORMAL),
+    'get_quizzes_by_lessons': ('quiz', 'read', NORMAL),
+    'get_quizzes_by_module': ('quiz', 'read', NORMAL),
+    'get_quizzes_by_course': ('quiz', 'read', NORMAL),
+    'submit_quiz_attempt': ('quiz', 'write', HIGH),
+    'get_user_quiz_attempts': ('quiz', 'read', NORMAL),
+    'get_course_quiz_status': ('quiz', 'read', NORMAL),
+    'get_quiz_analysis': ('quiz', 'report', LOW),
+    'get_progress': ('progress', 'read', NORMAL),
+    'get_course_progress': ('progress', 'read', NORMAL),
+    'start_lesson': ('progress', 'write', HIGH),
+    'complete_lesson': ('progress', 'write', HIGH),
+    'record_progress_events': ('progress', 'write', HIGH),
+    'get_weekly_report': ('report', 'report', LOW),
+    'get_report_history': ('report', 'report', LOW),
+    'generate_reports': ('report', 'report', LOW),
+    'batch': (None, 'read', NORMAL),
+}
+
+
+class Rejected(Exception):
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """Take one token; return 0 if allowed, else seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token bucket per (client, rate class), keeping at most max_clients buckets"""
+
+    def __init__(self, limits, max_clients=100000):
+        self.limits = limits
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client, rate_class):
+        limit = self.limits.get(rate_class)
+        if not limit:
+            return 0
+        key = (client, rate_class)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(*limit)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.take(time.monotonic())
+
+    def tracked_clients(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+class ConcurrencyLimiter:
+    """In-flight request cap for one upstream service.
+
+    High priority requests may use every slot, normal ones a share of them and
+    low priority ones a smaller share, so writes still get through while
+    report reads are being shed.
+    """
+
+    def __init__(self, limit, shares):
+        self.limit = limit
+        self.caps = {priority: max(1, int(limit * share)) for priority, share in shares.items()}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, priority):
+        with self._lock:
+            if self._in_flight >= self.caps.get(priority, self.limit):
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+
+class AdmissionController:
+    def __init__(self, rate_limits, concurrency_limit, shares, enabled=True):
+        self.enabled = enabled
+        self.rate_limiter = RateLimiter(rate_limits)
+        self.concurrency = {}
+        self.concurrency_limit = concurrency_limit
+        self.shares = shares
+        self._lock = threading.Lock()
+        self._admitted = {}
+        self._rejected = {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            rate_limits={
+                'read': (config.RATE_READ_PER_SEC, config.RATE_READ_BURST),
+                'write': (config.RATE_WRITE_PER_SEC, config.RATE_WRITE_BURST),
+                'report': (config.RATE_REPORT_PER_SEC, config.RATE_REPORT_BURST),
+                'auth': (config.RATE_AUTH_PER_SEC, config.RATE_AUTH_BURST),
+            },
+            concurrency_limit=config.UPSTREAM_CONCURRENCY_LIMIT,
+            shares={HIGH: 1.0, NORMAL: config.CONCURRENCY_SHARE_NORMAL, LOW: config.CONCURRENCY_SHARE_LOW},
+            enabled=config.ADMISSION_ENABLED
+        )
+
+    def admit(self, endpoint, client):
+        """Return a release callback for an admitted request, or raise Rejected"""
+        policy = ROUTE_POLICY.get(endpoint)
+        if not self.enabled or policy is None:
+            return None
+        service, rate_class, priority = policy
+
+        wait = self.rate_limiter.check(client, rate_class)
+        if wait:
+            self._count(self._rejected, f'{rate_class}_rate_limited')
+            raise Rejected(429, 'Rate limit exceeded', wait)
+
+        if service is None:
+            self._count(self._admitted, rate_class)
+            return None
+
+        limiter = self._limiter(service)
+        if not limiter.try_acquire(priority):
+            self._count(self._rejected, f'{rate_class}_overloaded')
+            raise Rejected(503, f'{service} service overloaded', 1)
+        self._count(self._admitted, rate_class)
+        return limiter.release
+
+    def _limiter(self, service):
+        with self._lock:
+            limiter = self.concurrency.get(service)
+            if limiter is None:
+                limiter = self.concurrency[service] = ConcurrencyLimiter(self.concurrency_limit, self.shares)
+            return limiter
+
+    def _count(self, counters, key):
+        with self._lock:
+            counters[key] = counters.get(key, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'tracked_clients': self.rate_limiter.tracked_clients(),
+                'admitted': dict(self._admitted),
+                'rejected': dict(self._rejected),
+                'in_flight': {service: limiter.in_flight for service, limiter in self.concurrency.items()},
+                'concurrency_limit': self.concurrency_limit
+            }
@@ -1,197 +1,491 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, g
 from flask_cors import CORS
-from dotenv import load_dotenv
-import requests
-import os
+from config import Config
+from upstream import Upstream
+from cache import ResponseCache, CachedResponse
+from tree import build_course_tree, UpstreamError
+from batch import run_batch
+from auth_middleware import token_required, token_cache, bearer_token, decode_token
+from resilience import CircuitOpenError
+from metrics import Metrics, stats_collector
+from admission import AdmissionController, Rejected
+from compression import Compressor
+import jwt
+import math
+from concurrent.futures import ThreadPoolExecutor
+import json
 
-load_dotenv()
 app = Flask(__name__)
 CORS(app)
+app.config.from_object(Config)
+metrics = Metrics('gateway')
+metrics.init_app(app)
+compressor = Compressor.from_config(Config)
+compressor.init_app(app)
 
 # Service endpoints
-AUTH_SERVICE = os.getenv('AUTH_SERVICE', 'http://localhost:5001')
-COURSE_SERVICE = os.getenv('COURSE_SERVICE', 'http://localhost:5002')
-QUIZ_SERVICE = os.getenv('QUIZ_SERVICE', 'http://localhost:5003')
-PROGRESS_SERVICE = os.getenv('PROGRESS_SERVICE', 'http://localhost:5004')
-REPORT_SERVICE = os.getenv('REPORT_SERVICE', 'http://localhost:5005')
+AUTH_SERVICE = Config.AUTH_SERVICE
+COURSE_SERVICE = Config.COURSE_SERVICE
+QUIZ_SERVICE = Config.QUIZ_SERVICE
+PROGRESS_SERVICE = Config.PROGRESS_SERVICE
+REPORT_SERVICE = Config.REPORT_SERVICE
+
+# Pooled keep-alive clients, one per service
+upstream = Upstream.from_config(Config, metrics=metrics)
+
+# Worker threads for fan-out endpoints
+fanout_executor = ThreadPoolExecutor(max_workers=Config.FANOUT_WORKERS, thread_name_prefix='fanout')
+# Separate pool for /api/batch so batched fan-out endpoints cannot starve each other
+batch_executor = ThreadPoolExecutor(max_workers=Config.BATCH_WORKERS, thread_name_prefix='batch')
+
+# Response cache for public catalog reads
+response_cache = ResponseCache(max_entries=Config.CACHE_MAX_ENTRIES, enabled=Config.CACHE_ENABLED)
+
+def fetch_catalog(route, service, path, ttl):
+    """Fetch a public GET through the response cache, filling it on a miss.
+
+    Returns a CachedResponse. Takes no headers on purpose: anything that
+    depends on the caller's Authorization must not go through here. An expired
+    entry is revalidated with If-None-Match, so an unchanged upstream answers
+    304 and the cached body is kept.
+    """
+    entry = response_cache.get(path, route)
+    if entry:
+        return entry
+
+    stale = response_cache.stale(path)
+    headers = {'If-None-Match': stale.etag} if stale else None
+    response = upstream.get(service, path, headers=headers)
+    if stale and response.status_code == 304:
+        response_cache.refresh(path, ttl)
+        return stale
+
+    content_type = response.headers.get('Content-Type', 'application/json')
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if response.status_code == 200 and content_type.startswith('application/json'):
+        response_cache.set(path, response.content, 200, content_type, ttl, etag, last_modified)
+    return CachedResponse(response.content, response.status_code, content_type, 0, etag, last_modified)
+
+def catalog_json(route, path, ttl):
+    entry = fetch_catalog(route, 'course', path, ttl)
+    return entry.status, json.loads(entry.body)
+
+def upstream_json(service, path, **kwargs):
+    response = upstream.get(service, path, **kwargs)
+    return response.status_code, response.json()
+
+def upstream_error(e):
+    """Error response for a failed upstream call: fail fast with 503 while a breaker is open"""
+    response = jsonify({'error': str(e)})
+    response.status_code = 500
+    if isinstance(e, CircuitOpenError):
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response
+
+# Upstream response headers relayed to the client by proxy()
+RELAYED_HEADERS = ('Content-Type', 'Cache-Control', 'ETag', 'Last-Modified', 'Vary')
+
+# Client validators forwarded on GETs so the upstream can answer 304
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+def proxy(service, method, path, headers=None, **kwargs):
+    """Relay an upstream response to the client without decoding the body.
+
+    GETs without credentials are read in full so identical concurrent calls
+    can be coalesced; everything else streams the upstream bytes (still
+    content-encoded) to the client in chunks as they arrive.
+    """
+    headers = dict(headers or {})
+    if method == 'GET' and Config.PASSTHROUGH_ENABLED:
+        headers.update({h: request.headers[h] for h in CONDITIONAL_HEADERS if h in request.headers})
+    if method == 'GET' and 'Authorization' not in headers:
+        response = upstream.get(service, path, headers=headers, **kwargs)
+        if not Config.PASSTHROUGH_ENABLED:
+            return jsonify(response.json()), response.status_code
+        relayed = {h: response.headers[h] for h in RELAYED_HEADERS if h in response.headers}
+        return Response(response.content, status=response.status_code, headers=relayed)
+
+    if not Config.PASSTHROUGH_ENABLED:
+        response = upstream.request(service, method, path, headers=headers, **kwargs)
+        return jsonify(response.json()), response.status_code
+
+    headers['Accept-Encoding'] = request.headers.get('Accept-Encoding', 'identity')
+    response = upstream.request(service, method, path, headers=headers, stream=True, **kwargs)
+    relayed = {h: response.headers[h] for h in RELAYED_HEADERS + ('Content-Encoding', 'Content-Length') if h in response.headers}
+    chunks = response.raw.stream(Config.PASSTHROUGH_CHUNK_SIZE, decode_content=False)
+    result = Response(chunks, status=response.status_code, headers=relayed, direct_passthrough=True)
+    # Returns the connection (and its pool slot) once the client has the body
+    result.call_on_close(response.close)
+    return result
+
+def cached_get(route, service, path, ttl):
+    """Serve a catalog read from the cache, answering 304 when the client's validators match
+    and reusing a precompressed body when the client accepts one"""
+    entry = fetch_catalog(route, service, path, ttl)
+    response = Response(entry.body, status=entry.status, content_type=entry.content_type)
+    if entry.status != 200:
+        return response
+    if entry.etag:
+        response.headers['ETag'] = entry.etag
+        if entry.last_modified:
+            response.headers['Last-Modified'] = entry.last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        response = response.make_conditional(request)
+    # Cached bodies are compressed once and the bytes kept with the entry
+    encoding = compressor.wants(response)
+    if encoding and len(entry.body) >= compressor.min_size:
+        compressor.apply(response, precompressed(entry, encoding), encoding)
+    return response
+
+def precompressed(entry, encoding):
+    """Compressed body of a cache entry, computed once per encoding and reused"""
+    data = entry.encoded.get(encoding)
+    if data is None:
+        data = entry.encoded[encoding] = compressor.encode(entry.body, encoding)
+    else:
+        compressor.record(len(entry.body), len(data), precompressed=True)
+    return data
+
+# Rate limits and per-service concurrency caps, checked before any handler runs
+admission = AdmissionController.from_config(Config)
+
+def client_identity():
+    token = bearer_token()
+    if token:
+        try:
+            return f"user:{decode_token(token)['user_id']}"
+        except (jwt.InvalidTokenError, KeyError):
+            pass
+    return f'ip:{request.remote_addr}'
+
+@app.before_request
+def admit_request():
+    try:
+        g.admission_release = admission.admit(request.endpoint, client_identity())
+    except Rejected as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = e.status
+        response.headers['Retry-After'] = e.retry_after_header()
+        return response
+
+@app.after_request
+def hold_admission_while_streaming(response):
+    """Teardown runs before a streamed body is sent, so keep its slot until the response closes"""
+    if response.is_streamed:
+        release = g.pop('admission_release', None)
+        if release:
+            response.call_on_close(release)
+    return response
+
+@app.teardown_request
+def release_admission(exc=None):
+    release = g.pop('admission_release', None)
+    if release:
+        release()
+
+metrics.register_collector(stats_collector('upstream', upstream.stats, label='upstream'))
+metrics.register_collector(stats_collector('coalescing', upstream.coalescing_stats))
+metrics.register_collector(stats_collector('response_cache', response_cache.stats))
+metrics.register_collector(stats_collector('token_cache', token_cache.stats))
+metrics.register_collector(stats_collector('admission', admission.stats))
+metrics.register_collector(stats_collector('compression', compressor.route_stats, label='route'))
 
 # Health check
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'service': 'gateway'}), 200
 
+# Gateway runtime stats
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'upstream': upstream.stats(),
+        'coalescing': upstream.coalescing_stats(),
+        'cache': response_cache.stats(),
+        'token_cache': token_cache.stats(),
+        'admission': admission.stats(),
+        'compression': compressor.stats()
+    }), 200
+
 # ============ AUTH ROUTES ============
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.get_json()
     try:
-        response = requests.post(f'{AUTH_SERVICE}/auth/register', json=data)
-        return jsonify(response.json()), response.status_code
+        return proxy('auth', 'POST', '/auth/register', json=data)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
     try:
-        response = requests.post(f'{AUTH_SERVICE}/auth/login', json=data)
-        return jsonify(response.json()), response.status_code
+        return proxy('auth', 'POST', '/auth/login', json=data)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/auth/verify', methods=['POST'])
 def verify_token():
     data = request.get_json()
     try:
-        response = requests.post(f'{AUTH_SERVICE}/auth/verify', json=data)
-        return jsonify(response.json()), response.status_code
+        return proxy('auth', 'POST', '/auth/verify', json=data)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/auth/me', methods=['GET'])
-def get_me():
+@token_required
+def get_me(payload):
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.get(f'{AUTH_SERVICE}/auth/me', headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('auth', 'GET', '/auth/me', headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 # ============ COURSE ROUTES ============
 @app.route('/api/courses', methods=['GET'])
 def get_courses():
     try:
-        response = requests.get(f'{COURSE_SERVICE}/courses')
-        return jsonify(response.json()), response.status_code
+        return cached_get('courses', 'course', '/courses', Config.CACHE_TTL_COURSES)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/courses/<int:course_id>', methods=['GET'])
 def get_course(course_id):
     try:
-        response = requests.get(f'{COURSE_SERVICE}/courses/{course_id}')
-        return jsonify(response.json()), response.status_code
+        return cached_get('course', 'course', f'/courses/{course_id}', Config.CACHE_TTL_COURSE)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/courses', methods=['POST'])
-def create_course():
+@token_required
+def create_course(payload):
     data = request.get_json()
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.post(f'{COURSE_SERVICE}/courses', json=data, headers=headers)
-        return jsonify(response.json()), response.status_code
+        response = upstream.post('course', '/courses', json=data, headers=headers)
+        body = response.json()
+        if 200 <= response.status_code < 300:
+            response_cache.invalidate('/courses')
+            if body.get('course_id'):
+                response_cache.invalidate(f"/courses/{body['course_id']}")
+                response_cache.invalidate(f"/courses/{body['course_id']}/modules")
+        return jsonify(body), response.status_code
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/courses/<int:course_id>/modules', methods=['GET'])
 def get_modules(course_id):
     try:
-        response = requests.get(f'{COURSE_SERVICE}/courses/{course_id}/modules')
-        return jsonify(response.json()), response.status_code
+        return cached_get('modules', 'course', f'/courses/{course_id}/modules', Config.CACHE_TTL_MODULES)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/modules/<int:module_id>/lessons', methods=['GET'])
 def get_lessons(module_id):
     try:
-        response = requests.get(f'{COURSE_SERVICE}/modules/{module_id}/lessons')
-        return jsonify(response.json()), response.status_code
+        return cached_get('lessons', 'course', f'/modules/{module_id}/lessons', Config.CACHE_TTL_LESSONS)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
+
+@app.route('/api/courses/<int:course_id>/tree', methods=['GET'])
+def get_course_tree(course_id):
+    """Course with modules, lessons and quizzes in one call.
+
+    ?quizzes=false skips quiz lookups; ?progress=true overlays the caller's
+    lesson status (requires a Bearer token).
+    """
+    include_quizzes = request.args.get('quizzes', 'true').lower() != 'false'
+    get_progress = None
+    if request.args.get('progress', 'false').lower() == 'true':
+        if not bearer_token():
+            return jsonify({'error': 'No token provided'}), 401
+        try:
+            decode_token(bearer_token())
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+        headers = {'Authorization': request.headers.get('Authorization', '')}
+        get_progress = lambda cid: upstream_json('progress', f'/progress/course/{cid}', headers=headers)
+
+    try:
+        tree = build_course_tree(
+            fanout_executor,
+            get_course=lambda cid: catalog_json('course', f'/courses/{cid}', Config.CACHE_TTL_COURSE),
+            get_modules=lambda cid: catalog_json('modules', f'/courses/{cid}/modules', Config.CACHE_TTL_MODULES),
+            get_lessons=lambda mid: catalog_json('lessons', f'/modules/{mid}/lessons', Config.CACHE_TTL_LESSONS),
+            get_quiz=lambda lid: upstream_json('quiz', f'/quizzes/lesson/{lid}'),
+            course_id=course_id,
+            include_quizzes=include_quizzes,
+            get_progress=get_progress
+        )
+        return jsonify(tree), 200
+    except UpstreamError as e:
+        return jsonify(e.body), e.status
+    except Exception as e:
+        return upstream_error(e)
 
 # ============ QUIZ ROUTES ============
 @app.route('/api/quizzes/lesson/<int:lesson_id>', methods=['GET'])
 def get_quiz(lesson_id):
     try:
-        response = requests.get(f'{QUIZ_SERVICE}/quizzes/lesson/{lesson_id}')
-        return jsonify(response.json()), response.status_code
+        return proxy('quiz', 'GET', f'/quizzes/lesson/{lesson_id}')
+    except Exception as e:
+        return upstream_error(e)
+
+@app.route('/api/quizzes/lessons', methods=['GET'])
+def get_quizzes_by_lessons():
+    try:
+        return proxy('quiz', 'GET', '/quizzes/lessons', params=request.args.to_dict())
+    except Exception as e:
+        return upstream_error(e)
+
+@app.route('/api/quizzes/module/<int:module_id>', methods=['GET'])
+def get_quizzes_by_module(module_id):
+    try:
+        return proxy('quiz', 'GET', f'/quizzes/module/{module_id}', params=request.args.to_dict())
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
+
+@app.route('/api/quizzes/course/<int:course_id>', methods=['GET'])
+def get_quizzes_by_course(course_id):
+    try:
+        return proxy('quiz', 'GET', f'/quizzes/course/{course_id}', params=request.args.to_dict())
+    except Exception as e:
+        return upstream_error(e)
 
 @app.route('/api/quizzes/<int:quiz_id>/attempts', methods=['POST'])
-def submit_quiz_attempt(quiz_id):
+@token_required
+def submit_quiz_attempt(payload, quiz_id):
     data = request.get_json()
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.post(f'{QUIZ_SERVICE}/quizzes/{quiz_id}/attempts', json=data, headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('quiz', 'POST', f'/quizzes/{quiz_id}/attempts', json=data, headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/quizzes/<int:quiz_id>/attempts/user', methods=['GET'])
-def get_user_quiz_attempts(quiz_id):
+@token_required
+def get_user_quiz_attempts(payload, quiz_id):
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.get(f'{QUIZ_SERVICE}/quizzes/{quiz_id}/attempts/user', headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('quiz', 'GET', f'/quizzes/{quiz_id}/attempts/user', headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
+
+@app.route('/api/quizzes/course/<int:course_id>/status', methods=['GET'])
+@token_required
+def get_course_quiz_status(payload, course_id):
+    headers = {'Authorization': request.headers.get('Authorization', '')}
+    try:
+        return proxy('quiz', 'GET', f'/quizzes/course/{course_id}/status', headers=headers)
+    except Exception as e:
+        return upstream_error(e)
+
+@app.route('/api/quizzes/<int:quiz_id>/analysis', methods=['GET'])
+@token_required
+def get_quiz_analysis(payload, quiz_id):
+    headers = {'Authorization': request.headers.get('Authorization', '')}
+    try:
+        return proxy('quiz', 'GET', f'/quizzes/{quiz_id}/analysis', headers=headers)
+    except Exception as e:
+        return upstream_error(e)
 
 # ============ PROGRESS ROUTES ============
 @app.route('/api/progress', methods=['GET'])
-def get_progress():
+@token_required
+def get_progress(payload):
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.get(f'{PROGRESS_SERVICE}/progress', headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('progress', 'GET', '/progress', headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/progress/course/<int:course_id>', methods=['GET'])
-def get_course_progress(course_id):
+@token_required
+def get_course_progress(payload, course_id):
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.get(f'{PROGRESS_SERVICE}/progress/course/{course_id}', headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('progress', 'GET', f'/progress/course/{course_id}', headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/progress/lesson/<int:lesson_id>/start', methods=['POST'])
-def start_lesson(lesson_id):
+@token_required
+def start_lesson(payload, lesson_id):
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.post(f'{PROGRESS_SERVICE}/progress/lesson/{lesson_id}/start', headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('progress', 'POST', f'/progress/lesson/{lesson_id}/start', headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/progress/lesson/<int:lesson_id>/complete', methods=['POST'])
-def complete_lesson(lesson_id):
+@token_required
+def complete_lesson(payload, lesson_id):
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.post(f'{PROGRESS_SERVICE}/progress/lesson/{lesson_id}/complete', headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('progress', 'POST', f'/progress/lesson/{lesson_id}/complete', headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
+
+@app.route('/api/progress/events', methods=['POST'])
+@token_required
+def record_progress_events(payload):
+    data = request.get_json()
+    headers = {'Authorization': request.headers.get('Authorization', '')}
+    if 'Idempotency-Key' in request.headers:
+        headers['Idempotency-Key'] = request.headers['Idempotency-Key']
+    try:
+        return proxy('progress', 'POST', '/progress/events', json=data, headers=headers)
+    except Exception as e:
+        return upstream_error(e)
 
 # ============ REPORT ROUTES ============
 @app.route('/api/reports/week', methods=['GET'])
-def get_weekly_report():
+@token_required
+def get_weekly_report(payload):
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.get(f'{REPORT_SERVICE}/reports/week', headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('report', 'GET', '/reports/week', headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/reports/history', methods=['GET'])
-def get_report_history():
+@token_required
+def get_report_history(payload):
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.get(f'{REPORT_SERVICE}/reports/history', headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('report', 'GET', '/reports/history', headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
 
 @app.route('/api/reports/generate', methods=['POST'])
 def generate_reports():
     headers = {'Authorization': request.headers.get('Authorization', '')}
     try:
-        response = requests.post(f'{REPORT_SERVICE}/reports/generate', headers=headers)
-        return jsonify(response.json()), response.status_code
+        return proxy('report', 'POST', '/reports/generate', headers=headers)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return upstream_error(e)
+
+# ============ BATCH ROUTE ============
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    """Run several /api sub-requests concurrently in one round trip"""
+    data = request.get_json()
+    items = data.get('requests') if isinstance(data, dict) else None
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Missing requests'}), 400
+    if len(items) > Config.BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Too many requests in batch (max {Config.BATCH_MAX_ITEMS})'}), 413
+
+    results = run_batch(
+        app, batch_executor, items,
+        authorization=request.headers.get('Authorization'),
+        timeout=Config.BATCH_TIMEOUT,
+        remote_addr=request.remote_addr
+    )
+    return jsonify({'responses': results}), 200
 
 # ============ STATIC CONTENT (if serving frontend) ============
 @app.route('/', methods=['GET'])
@@ -209,4 +503,4 @@ def index():
     }), 200
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=Config.PORT, debug=True)
@@ -0,0 +1,256 @@
+"""Asyncio serving mode for the gateway.
+
+Serves the proxied /api routes of app.py (see routes.py) with non-blocking
+aiohttp calls, so a single process can hold thousands of in-flight requests
+instead of one per worker thread. Routes app.py builds itself (the course
+tree and /api/batch) answer 501 here; the response cache, request coalescing and
+admission control are Flask-mode only.
+
+    python async_app.py
+    gunicorn async_app:app --worker-class aiohttp.GunicornWebWorker
+"""
+import asyncio
+import functools
+import json
+import math
+import re
+import time
+import jwt
+from aiohttp import web, ClientSession, ClientTimeout, TCPConnector
+from auth_middleware import decode_token, token_cache
+from config import Config
+from routes import ROUTES
+from upstream import SERVICES, PoolStats
+from resilience import CircuitBreaker, CircuitOpenError
+
+# Same key order and escaping as Flask's jsonify
+dumps = functools.partial(json.dumps, sort_keys=True)
+
+
+class AsyncServiceClient:
+    """Non-blocking counterpart of upstream.ServiceClient"""
+
+    def __init__(self, name, base_url, pool_size, connect_timeout, read_timeout, keep_alive=True,
+                 breaker=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.keep_alive = keep_alive
+        self.pool = PoolStats(self.base_url, pool_size)
+        self.breaker = breaker or CircuitBreaker()
+        self.session = None
+        self._slots = None
+
+    async def start(self):
+        connector = TCPConnector(limit=self.pool_size, force_close=not self.keep_alive)
+        self.session = ClientSession(connector=connector, timeout=self.timeout)
+        self._slots = asyncio.Semaphore(self.pool_size)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def request(self, method, path, **kwargs):
+        """Return (status, decoded JSON body) of an upstream call"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+
+        started = time.monotonic()
+        async with self._slots:
+            self.pool.acquired(time.monotonic() - started)
+            try:
+                async with self.session.request(method, f'{self.base_url}{path}', **kwargs) as response:
+                    body = await response.read()
+            except Exception:
+                self.pool.error()
+                self.breaker.record_failure()
+                raise
+            finally:
+                self.pool.released()
+
+        if response.status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response.status, json.loads(body)
+
+    def stats(self):
+        stats = self.pool.snapshot()
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+
+class AsyncUpstream:
+    def __init__(self, clients):
+        self.clients = clients
+
+    @classmethod
+    def from_config(cls, config):
+        clients = {}
+        for name in SERVICES:
+            clients[name] = AsyncServiceClient(
+                name,
+                getattr(config, f'{name.upper()}_SERVICE'),
+                pool_size=config.ASYNC_UPSTREAM_POOL_SIZE,
+                connect_timeout=config.UPSTREAM_CONNECT_TIMEOUT,
+                read_timeout=getattr(config, f'{name.upper()}_SERVICE_TIMEOUT'),
+                keep_alive=config.UPSTREAM_KEEP_ALIVE,
+                breaker=CircuitBreaker(config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RESET_TIMEOUT)
+            )
+        return cls(clients)
+
+    async def start(self, app=None):
+        for client in self.clients.values():
+            await client.start()
+
+    async def close(self, app=None):
+        for client in self.clients.values():
+            await client.close()
+
+    async def request(self, service, method, path, **kwargs):
+        return await self.clients[service].request(method, path, **kwargs)
+
+    def stats(self):
+        return {name: client.stats() for name, client in self.clients.items()}
+
+
+class JSONBodyError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def json_response(data, status=200):
+    return web.json_response(data, status=status, dumps=dumps)
+
+
+async def read_json(request):
+    """Mirror Flask's request.get_json(): 415 for non-JSON content, 400 for bad JSON"""
+    if request.content_type != 'application/json' and not request.content_type.endswith('+json'):
+        raise JSONBodyError(415, "Did not attempt to load JSON data because the request Content-Type was not 'application/json'.")
+    body = await request.read()
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise JSONBodyError(400, f'Failed to decode JSON object: {e}')
+
+
+def check_token(request):
+    """The token_required check: a 401 response for a missing or invalid Bearer token, else None"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not token:
+        return json_response({'error': 'No token provided'}, 401)
+    try:
+        decode_token(token, request.app['config'].SECRET_KEY)
+    except jwt.InvalidTokenError:
+        return json_response({'error': 'Invalid token'}, 401)
+    return None
+
+
+def make_proxy_handler(method, service, upstream_path, sends_json, sends_auth, requires_token):
+    async def handler(request):
+        if requires_token:
+            rejected = check_token(request)
+            if rejected is not None:
+                return rejected
+        kwargs = {}
+        if sends_json:
+            try:
+                kwargs['json'] = await read_json(request)
+            except JSONBodyError as e:
+                return json_response({'error': str(e)}, e.status)
+        if sends_auth:
+            kwargs['headers'] = {'Authorization': request.headers.get('Authorization', '')}
+            if 'Idempotency-Key' in request.headers:
+                kwargs['headers']['Idempotency-Key'] = request.headers['Idempotency-Key']
+        if request.query:
+            kwargs['params'] = request.query
+
+        try:
+            status, data = await request.app['upstream'].request(
+                service, method, upstream_path.format(**request.match_info), **kwargs
+            )
+            return json_response(data, status)
+        except CircuitOpenError as e:
+            response = json_response({'error': str(e)}, 503)
+            response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+            return response
+        except Exception as e:
+            return json_response({'error': str(e)}, 500)
+    return handler
+
+
+def aiohttp_path(path):
+    # Every path parameter in the Flask app is <int:...>
+    return re.sub(r'\{(\w+)\}', r'{\1:\\d+}', path)
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Allow any origin, like CORS(app) in the Flask gateway"""
+    if request.method == 'OPTIONS' and 'Access-Control-Request-Method' in request.headers:
+        response = web.Response(status=200)
+        response.headers['Access-Control-Allow-Methods'] = request.headers['Access-Control-Request-Method']
+        if 'Access-Control-Request-Headers' in request.headers:
+            response.headers['Access-Control-Allow-Headers'] = request.headers['Access-Control-Request-Headers']
+    else:
+        response = await handler(request)
+    if 'Origin' in request.headers:
+        response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+# Routes app.py serves by aggregating or dispatching several calls, not by proxying one
+GATEWAY_ONLY_ROUTES = [
+    ('GET', '/api/courses/{course_id}/tree'),
+    ('POST', '/api/batch'),
+]
+
+
+async def gateway_only(request):
+    return json_response({'error': f'{request.path} is only served by the Flask gateway (python app.py)'}, 501)
+
+
+async def health(request):
+    return json_response({'status': 'healthy', 'service': 'gateway', 'mode': 'async'})
+
+
+async def stats(request):
+    return json_response({'upstream': request.app['upstream'].stats(), 'token_cache': token_cache.stats()})
+
+
+async def index(request):
+    config = request.app['config']
+    return json_response({
+        'message': 'Learning Tracker API Gateway',
+        'version': '1.0',
+        'services': {name: f"{getattr(config, f'{name.upper()}_SERVICE')}/health" for name in SERVICES}
+    })
+
+
+def create_app(config=Config):
+    app = web.Application(middlewares=[cors_middleware])
+    upstream = AsyncUpstream.from_config(config)
+    app['config'] = config
+    app['upstream'] = upstream
+    app.on_startup.append(upstream.start)
+    app.on_cleanup.append(upstream.close)
+
+    app.router.add_get('/health', health)
+    app.router.add_get('/stats', stats)
+    for method, path, service, upstream_path, sends_json, sends_auth, requires_token in ROUTES:
+        app.router.add_route(
+            method, aiohttp_path(path),
+            make_proxy_handler(method, service, upstream_path, sends_json, sends_auth, requires_token)
+        )
+    for method, path in GATEWAY_ONLY_ROUTES:
+        app.router.add_route(method, aiohttp_path(path), gateway_only)
+    app.router.add_get('/', index)
+    return app
+
+
+app = create_app()
+
+if __name__ == '__main__':
+    web.run_app(app, host='0.0.0.0', port=Config.PORT)
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, jsonify, current_app, g
+import jwt
+from config import Config
+
+
+class TokenCache:
+    """Bounded LRU of decoded JWT payloads keyed by the raw token.
+
+    A hit skips the signature check. Entries never outlive the token's own
+    exp claim, so an expired token always goes back through jwt.decode.
+    """
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._verifications = 0
+        self._failures = 0
+        self._verify_total = 0.0
+        self._verify_max = 0.0
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[token]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, token, payload):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if 'exp' in payload:
+            expires_at = min(expires_at, payload['exp'])
+        with self._lock:
+            self._entries[token] = (payload, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_verification(self, seconds, ok):
+        with self._lock:
+            self._verifications += 1
+            if not ok:
+                self._failures += 1
+            self._verify_total += seconds
+            self._verify_max = max(self._verify_max, seconds)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0,
+                'verifications': self._verifications,
+                'verification_failures': self._failures,
+                'verify_avg_ms': round(self._verify_total / self._verifications * 1000, 3) if self._verifications else 0,
+                'verify_max_ms': round(self._verify_max * 1000, 3)
+            }
+
+
+token_cache = TokenCache(max_entries=Config.TOKEN_CACHE_SIZE, ttl=Config.TOKEN_CACHE_TTL)
+
+
+def decode_token(token, secret_key=None):
+    """Return the payload of a valid token, raising jwt.InvalidTokenError otherwise.
+
+    `secret_key` defaults to the current Flask app's SECRET_KEY.
+    """
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    started = time.perf_counter()
+    try:
+        payload = jwt.decode(token, secret_key or current_app.config['SECRET_KEY'], algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        token_cache.record_verification(time.perf_counter() - started, False)
+        raise
+    token_cache.record_verification(time.perf_counter() - started, True)
+    token_cache.set(token, payload)
+    return payload
+
+
+def bearer_token():
+    return request.headers.get('Authorization', '').replace('Bearer ', '')
+
+
+def token_required(f):
+    """Reject requests without a valid Bearer token; pass its payload as the first argument"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = bearer_token()
+
+        if not token:
+            return jsonify({'error': 'No token provided'}), 401
+
+        try:
+            payload = decode_token(token)
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+        g.token_payload = payload
+        return f(payload, *args, **kwargs)
+    return decorated
@@ -0,0 +1,61 @@
+import json
+from concurrent.futures import wait
+
+
+def run_batch(app, executor, items, authorization=None, timeout=10, remote_addr=None):
+    """Dispatch sub-requests through the app's own routes concurrently.
+
+    Each item is {"id", "method", "path", "body"}; the caller's Authorization
+    header and address apply to every item, so items are rate limited as
+    the caller. Items still running when the time budget runs out are
+    reported with status 504.
+    """
+    futures = [executor.submit(_run_item, app, item, authorization, remote_addr) for item in items]
+    done, _ = wait(futures, timeout=timeout)
+
+    results = []
+    for index, (item, future) in enumerate(zip(items, futures)):
+        item_id = item.get('id', index) if isinstance(item, dict) else index
+        if future in done:
+            status, body = future.result()
+        else:
+            future.cancel()
+            status, body = 504, {'error': 'Batch time limit exceeded'}
+        results.append({'id': item_id, 'status': status, 'body': body})
+    return results
+
+
+def _run_item(app, item, authorization, remote_addr=None):
+    if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+        return 400, {'error': 'Missing path'}
+
+    path = item['path']
+    method = str(item.get('method', 'GET')).upper()
+    if not path.startswith('/api/') or path.startswith('/api/batch'):
+        return 400, {'error': 'Path must be an /api route other than /api/batch'}
+
+    kwargs = {'method': method, 'headers': {}}
+    if remote_addr:
+        kwargs['environ_base'] = {'REMOTE_ADDR': remote_addr}
+    if authorization:
+        kwargs['headers']['Authorization'] = authorization
+    if 'body' in item:
+        kwargs['json'] = item['body']
+
+    try:
+        with app.test_request_context(path, **kwargs):
+            response = app.full_dispatch_request()
+            try:
+                # Passthrough responses stream their body and refuse get_data()
+                data = b''.join(response.response) if response.direct_passthrough else response.get_data()
+            finally:
+                response.close()
+    except Exception as e:
+        return 500, {'error': str(e)}
+
+    if response.mimetype == 'application/json' or response.mimetype.endswith('+json'):
+        try:
+            return response.status_code, json.loads(data) if data else None
+        except ValueError:
+            pass
+    return response.status_code, data.decode('utf-8', 'replace')
@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResponse:
+    __slots__ = ('body', 'status', 'content_type', 'expires_at', 'etag', 'last_modified', 'encoded')
+
+    def __init__(self, body, status, content_type, expires_at, etag=None, last_modified=None):
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+        # Compressed copies of body by content-coding, filled on first use
+        self.encoded = {}
+
+
+class ResponseCache:
+    """Bounded LRU cache of upstream responses with a TTL per entry.
+
+    Only public catalog reads go through it; per-user routes are never cached.
+    Expired entries stay in place until evicted so they can be revalidated
+    upstream with their ETag instead of being fetched again.
+    """
+
+    def __init__(self, max_entries=1000, enabled=True):
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+        self._evictions = 0
+        self._invalidations = 0
+        self._revalidations = 0
+
+    def get(self, key, route):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                self._misses[route] = self._misses.get(route, 0) + 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits[route] = self._hits.get(route, 0) + 1
+            return entry
+
+    def stale(self, key):
+        """Expired entry for `key` that carries an ETag, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.etag is None:
+                return None
+            return entry
+
+    def refresh(self, key, ttl):
+        """Extend an entry the upstream confirmed unchanged (304)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires_at = time.monotonic() + ttl
+                self._entries.move_to_end(key)
+                self._revalidations += 1
+
+    def set(self, key, body, status, content_type, ttl, etag=None, last_modified=None):
+        if not self.enabled or ttl <= 0:
+            return
+        entry = CachedResponse(body, status, content_type, time.monotonic() + ttl, etag, last_modified)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            hits = sum(self._hits.values())
+            misses = sum(self._misses.values())
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'revalidations': self._revalidations,
+                'routes': {
+                    route: {'hits': self._hits.get(route, 0), 'misses': self._misses.get(route, 0)}
+                    for route in sorted(set(self._hits) | set(self._misses))
+                }
+            }
@@ -0,0 +1,79 @@
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse identical concurrent calls into one.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight wait and share its result or exception.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._leaders = {}
+        self._followers = {}
+
+    def do(self, group, key, fn):
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._leaders[group] = self._leaders.get(group, 0) + 1
+            else:
+                self._followers[group] = self._followers.get(group, 0) + 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            groups = {}
+            for group in sorted(set(self._leaders) | set(self._followers)):
+                leaders = self._leaders.get(group, 0)
+                followers = self._followers.get(group, 0)
+                groups[group] = {
+                    'requests': leaders + followers,
+                    'upstream_calls': leaders,
+                    'coalesced': followers,
+                    'coalescing_ratio': round(followers / (leaders + followers), 4)
+                }
+            leaders = sum(self._leaders.values())
+            followers = sum(self._followers.values())
+            return {
+                'enabled': self.enabled,
+                'in_flight': len(self._calls),
+                'requests': leaders + followers,
+                'upstream_calls': leaders,
+                'coalesced': followers,
+                'coalescing_ratio': round(followers / (leaders + followers), 4) if leaders + followers else 0,
+                'services': groups
+            }
@@ -1,4 +1,7 @@
 import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 class Config:
     AUTH_SERVICE = os.getenv('AUTH_SERVICE', 'http://localhost:5001')
@@ -7,3 +10,75 @@ class Config:
     PROGRESS_SERVICE = os.getenv('PROGRESS_SERVICE', 'http://localhost:5004')
     REPORT_SERVICE = os.getenv('REPORT_SERVICE', 'http://localhost:5005')
     ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
+    PORT = int(os.getenv('PORT', 5000))
+
+    # Tokens are verified at the edge with the same key the services use
+    SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-prod')
+    TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+    TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 300))
+
+    # Upstream connection pools (one per service)
+    UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 20))
+    UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 2))
+    UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', 10))
+    UPSTREAM_KEEP_ALIVE = os.getenv('UPSTREAM_KEEP_ALIVE', 'true').lower() == 'true'
+
+    # Per-service read timeout budgets (seconds)
+    AUTH_SERVICE_TIMEOUT = float(os.getenv('AUTH_SERVICE_TIMEOUT', UPSTREAM_READ_TIMEOUT))
+    COURSE_SERVICE_TIMEOUT = float(os.getenv('COURSE_SERVICE_TIMEOUT', UPSTREAM_READ_TIMEOUT))
+    QUIZ_SERVICE_TIMEOUT = float(os.getenv('QUIZ_SERVICE_TIMEOUT', UPSTREAM_READ_TIMEOUT))
+    PROGRESS_SERVICE_TIMEOUT = float(os.getenv('PROGRESS_SERVICE_TIMEOUT', UPSTREAM_READ_TIMEOUT))
+    REPORT_SERVICE_TIMEOUT = float(os.getenv('REPORT_SERVICE_TIMEOUT', UPSTREAM_READ_TIMEOUT))
+
+    # Circuit breakers: open after N consecutive failures, probe again after the reset timeout
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+    BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 10))
+
+    # Hedged GETs: second attempt after the service's recent p95 latency
+    HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'false').lower() == 'true'
+    HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 95))
+    HEDGE_MIN_DELAY_MS = float(os.getenv('HEDGE_MIN_DELAY_MS', 10))
+    HEDGE_WORKERS = int(os.getenv('HEDGE_WORKERS', 32))
+    # Relay upstream bodies as-is instead of decoding and re-encoding JSON
+    PASSTHROUGH_ENABLED = os.getenv('PASSTHROUGH_ENABLED', 'true').lower() == 'true'
+    PASSTHROUGH_CHUNK_SIZE = int(os.getenv('PASSTHROUGH_CHUNK_SIZE', 16384))
+    # Share one upstream call between identical in-flight unauthenticated GETs
+    COALESCE_ENABLED = os.getenv('COALESCE_ENABLED', 'true').lower() == 'true'
+    # Async serving mode holds many more in-flight calls per process
+    ASYNC_UPSTREAM_POOL_SIZE = int(os.getenv('ASYNC_UPSTREAM_POOL_SIZE', 100))
+
+    # Admission control: token buckets per client and route class (requests/sec, burst)
+    ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+    RATE_READ_PER_SEC = float(os.getenv('RATE_READ_PER_SEC', 20))
+    RATE_READ_BURST = float(os.getenv('RATE_READ_BURST', 40))
+    RATE_WRITE_PER_SEC = float(os.getenv('RATE_WRITE_PER_SEC', 10))
+    RATE_WRITE_BURST = float(os.getenv('RATE_WRITE_BURST', 20))
+    RATE_REPORT_PER_SEC = float(os.getenv('RATE_REPORT_PER_SEC', 2))
+    RATE_REPORT_BURST = float(os.getenv('RATE_REPORT_BURST', 5))
+    RATE_AUTH_PER_SEC = float(os.getenv('RATE_AUTH_PER_SEC', 1))
+    RATE_AUTH_BURST = float(os.getenv('RATE_AUTH_BURST', 5))
+    # In-flight cap per upstream service; normal and low priority requests get a share of it
+    UPSTREAM_CONCURRENCY_LIMIT = int(os.getenv('UPSTREAM_CONCURRENCY_LIMIT', 64))
+    CONCURRENCY_SHARE_NORMAL = float(os.getenv('CONCURRENCY_SHARE_NORMAL', 0.8))
+    CONCURRENCY_SHARE_LOW = float(os.getenv('CONCURRENCY_SHARE_LOW', 0.3))
+
+    # Threads for fan-out endpoints such as /api/courses/<id>/tree
+    FANOUT_WORKERS = int(os.getenv('FANOUT_WORKERS', 32))
+
+    # /api/batch limits
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 20))
+    BATCH_TIMEOUT = float(os.getenv('BATCH_TIMEOUT', 10))
+    BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 64))
+
+    # Response cache for catalog GETs (TTLs in seconds, 0 disables a route)
+    CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() == 'true'
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1000))
+    CACHE_TTL_COURSES = float(os.getenv('CACHE_TTL_COURSES', 30))
+    CACHE_TTL_COURSE = float(os.getenv('CACHE_TTL_COURSE', 60))
+    CACHE_TTL_MODULES = float(os.getenv('CACHE_TTL_MODULES', 120))
+    CACHE_TTL_LESSONS = float(os.getenv('CACHE_TTL_LESSONS', 120))
+
+    # Accept-Encoding negotiated gzip/deflate for JSON/text bodies of at least COMPRESSION_MIN_SIZE bytes
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 6))
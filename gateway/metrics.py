@@ -0,0 +1,167 @@
+import bisect
+import threading
+import time
+from flask import Response, g, request
+
+# Latency buckets in seconds (Prometheus "le" bounds; +Inf is implicit)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Metrics:
+    """Per-route request counters and latency histograms, rendered in the
+    Prometheus text format on /metrics.
+
+    Recording is one dict lookup and one bucket increment under a lock, so it
+    stays on in production.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._upstream = {}
+        self._collectors = []
+
+    def init_app(self, app):
+        app.before_request(self._start_timer)
+        app.after_request(self._record_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view, methods=['GET'])
+
+    def observe_request(self, route, method, status, seconds):
+        key = (route, method, str(status))
+        with self._lock:
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = Histogram()
+            histogram.observe(seconds)
+
+    def observe_upstream(self, upstream, status, seconds):
+        key = (upstream, str(status))
+        with self._lock:
+            histogram = self._upstream.get(key)
+            if histogram is None:
+                histogram = self._upstream[key] = Histogram()
+            histogram.observe(seconds)
+
+    def register_collector(self, collect):
+        """collect() yields (metric name, labels dict, value) gauges at scrape time"""
+        self._collectors.append(collect)
+
+    def _start_timer(self):
+        g.metrics_started = time.perf_counter()
+
+    def _record_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            self.observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+        return response
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def render(self):
+        with self._lock:
+            requests_snapshot = {k: (list(h.counts), h.sum, h.count) for k, h in self._requests.items()}
+            upstream_snapshot = {k: (list(h.counts), h.sum, h.count) for k, h in self._upstream.items()}
+
+        lines = []
+        service = {'service': self.service}
+
+        lines.append('# HELP http_requests_total Requests handled, by route and status')
+        lines.append('# TYPE http_requests_total counter')
+        errors = {}
+        for (route, method, status), (_, _, count) in sorted(requests_snapshot.items()):
+            lines.append(_sample('http_requests_total', dict(service, route=route, method=method, status=status), count))
+            if status.startswith('5'):
+                errors[(route, method)] = errors.get((route, method), 0) + count
+
+        lines.append('# HELP http_request_errors_total Requests answered with a 5xx status')
+        lines.append('# TYPE http_request_errors_total counter')
+        for (route, method), count in sorted(errors.items()):
+            lines.append(_sample('http_request_errors_total', dict(service, route=route, method=method), count))
+
+        lines.append('# HELP http_request_duration_seconds Request latency')
+        lines.append('# TYPE http_request_duration_seconds histogram')
+        for (route, method, status), values in sorted(requests_snapshot.items()):
+            _histogram(lines, 'http_request_duration_seconds', dict(service, route=route, method=method, status=status), values)
+
+        if upstream_snapshot:
+            lines.append('# HELP upstream_request_duration_seconds Time spent waiting on upstream services')
+            lines.append('# TYPE upstream_request_duration_seconds histogram')
+            for (upstream, status), values in sorted(upstream_snapshot.items()):
+                _histogram(lines, 'upstream_request_duration_seconds', dict(service, upstream=upstream, status=status), values)
+
+        gauges = {}
+        for collect in self._collectors:
+            for name, labels, value in collect():
+                gauges.setdefault(name, []).append((dict(service, **labels), value))
+        for name in sorted(gauges):
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in gauges[name]:
+                lines.append(_sample(name, labels, value))
+
+        return '\n'.join(lines) + '\n'
+
+
+def stats_collector(prefix, stats_fn, label=None):
+    """Expose the numeric leaves of a /stats-style dict as gauges.
+
+    With `label`, each top-level key becomes that label's value, e.g.
+    {"course": {"in_use": 3}} -> prefix_in_use{upstream="course"} 3.
+    """
+    def collect():
+        stats = stats_fn()
+        groups = stats.items() if label else [(None, stats)]
+        for key, values in groups:
+            labels = {label: key} if label else {}
+            for name, value in _numeric_leaves(values):
+                yield f'{prefix}_{name}', labels, value
+    return collect
+
+
+def _numeric_leaves(values, prefix=''):
+    for key, value in values.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+        elif isinstance(value, dict):
+            yield from _numeric_leaves(value, f'{name}_')
+
+
+def _histogram(lines, name, labels, values):
+    counts, total, count = values
+    cumulative = 0
+    for bound, bucket_count in zip(BUCKETS, counts):
+        cumulative += bucket_count
+        lines.append(_sample(f'{name}_bucket', dict(labels, le=repr(bound)), cumulative))
+    lines.append(_sample(f'{name}_bucket', dict(labels, le='+Inf'), count))
+    lines.append(_sample(f'{name}_sum', labels, round(total, 6)))
+    lines.append(_sample(f'{name}_count', labels, count))
+
+
+def _sample(name, labels, value):
+    if labels:
+        rendered = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        return f'{name}{{{rendered}}} {value}'
+    return f'{name} {value}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+    def __init__(self, service, retry_after):
+        super().__init__(f'{service} service unavailable (circuit open)')
+        self.service = service
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    closed -> open after `failure_threshold` failures in a row; open -> half-open
+    after `reset_timeout` seconds, letting one probe through; the probe's
+    outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=10):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._times_opened = 0
+        self._rejected = 0
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._rejected += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self._rejected += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def retry_after(self):
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'open': self._state == self.OPEN,
+                'consecutive_failures': self._failures,
+                'times_opened': self._times_opened,
+                'rejected': self._rejected
+            }
+
+
+class LatencyWindow:
+    """Recent upstream latencies, used to derive the hedging delay"""
+
+    def __init__(self, size=500):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, min_samples=20):
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class HedgeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._fired = 0
+        self._hedge_wins = 0
+
+    def record(self, fired, hedge_won):
+        with self._lock:
+            self._requests += 1
+            if fired:
+                self._fired += 1
+            if hedge_won:
+                self._hedge_wins += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'hedges_fired': self._fired,
+                'hedge_wins': self._hedge_wins,
+                'hedge_win_rate': round(self._hedge_wins / self._fired, 4) if self._fired else 0
+            }
@@ -0,0 +1,41 @@
+# Proxied /api routes shared by the async serving mode.
+# Keep in step with the Flask handlers in app.py.
+#
+# (method, gateway path, service, upstream path, forwards JSON body, forwards Authorization,
+#  rejects a missing or invalid token at the gateway like @token_required)
+ROUTES = [
+    # Auth
+    ('POST', '/api/auth/register', 'auth', '/auth/register', True, False, False),
+    ('POST', '/api/auth/login', 'auth', '/auth/login', True, False, False),
+    ('POST', '/api/auth/verify', 'auth', '/auth/verify', True, False, False),
+    ('GET', '/api/auth/me', 'auth', '/auth/me', False, True, True),
+
+    # Courses
+    ('GET', '/api/courses', 'course', '/courses', False, False, False),
+    ('GET', '/api/courses/{course_id}', 'course', '/courses/{course_id}', False, False, False),
+    ('POST', '/api/courses', 'course', '/courses', True, True, True),
+    ('GET', '/api/courses/{course_id}/modules', 'course', '/courses/{course_id}/modules', False, False, False),
+    ('GET', '/api/modules/{module_id}/lessons', 'course', '/modules/{module_id}/lessons', False, False, False),
+
+    # Quizzes
+    ('GET', '/api/quizzes/lesson/{lesson_id}', 'quiz', '/quizzes/lesson/{lesson_id}', False, False, False),
+    ('GET', '/api/quizzes/lessons', 'quiz', '/quizzes/lessons', False, False, False),
+    ('GET', '/api/quizzes/module/{module_id}', 'quiz', '/quizzes/module/{module_id}', False, False, False),
+    ('GET', '/api/quizzes/course/{course_id}', 'quiz', '/quizzes/course/{course_id}', False, False, False),
+    ('GET', '/api/quizzes/course/{course_id}/status', 'quiz', '/quizzes/course/{course_id}/status', False, True, True),
+    ('POST', '/api/quizzes/{quiz_id}/attempts', 'quiz', '/quizzes/{quiz_id}/attempts', True, True, True),
+    ('GET', '/api/quizzes/{quiz_id}/attempts/user', 'quiz', '/quizzes/{quiz_id}/attempts/user', False, True, True),
+    ('GET', '/api/quizzes/{quiz_id}/analysis', 'quiz', '/quizzes/{quiz_id}/analysis', False, True, True),
+
+    # Progress
+    ('GET', '/api/progress', 'progress', '/progress', False, True, True),
+    ('GET', '/api/progress/course/{course_id}', 'progress', '/progress/course/{course_id}', False, True, True),
+    ('POST', '/api/progress/lesson/{lesson_id}/start', 'progress', '/progress/lesson/{lesson_id}/start', False, True, True),
+    ('POST', '/api/progress/lesson/{lesson_id}/complete', 'progress', '/progress/lesson/{lesson_id}/complete', False, True, True),
+    ('POST', '/api/progress/events', 'progress', '/progress/events', True, True, True),
+
+    # Reports
+    ('GET', '/api/reports/week', 'report', '/reports/week', False, True, True),
+    ('GET', '/api/reports/history', 'report', '/reports/history', False, True, True),
+    ('POST', '/api/reports/generate', 'report', '/reports/generate', False, True, False),
+]
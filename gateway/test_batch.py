@@ -0,0 +1,88 @@
+"""/api/batch: streamed (passthrough) sub-responses and per-caller rate limits.
+
+    cd gateway && python -m unittest test_batch
+"""
+import datetime
+import unittest
+from unittest import mock
+import jwt
+from config import Config
+from admission import AdmissionController, HIGH, NORMAL, LOW
+import app as gateway
+
+
+class StubUpstreamResponse:
+    """Just enough of a requests.Response for proxy()'s streaming path"""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.headers = {'Content-Type': 'application/json', 'Content-Length': str(len(body))}
+        self.raw = mock.Mock()
+        self.raw.stream.return_value = iter([body[:5], body[5:]])
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class BatchPassthroughTest(unittest.TestCase):
+    def setUp(self):
+        token = jwt.encode(
+            {'user_id': 7, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+            Config.SECRET_KEY, algorithm='HS256'
+        )
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.client = gateway.app.test_client()
+        self.sent = []
+
+    def stub_request(self, service, method, path, **kwargs):
+        self.sent.append((method, path, kwargs.get('headers', {}).get('Authorization')))
+        if method == 'GET':
+            response = StubUpstreamResponse(200, b'{"id": 7, "email": "a@example.com"}')
+        else:
+            response = StubUpstreamResponse(201, b'{"message": "Lesson started"}')
+        self.responses.append(response)
+        return response
+
+    def run_batch(self, items):
+        self.responses = []
+        with mock.patch.object(gateway.Config, 'PASSTHROUGH_ENABLED', True), \
+                mock.patch.object(gateway.upstream, 'request', side_effect=self.stub_request):
+            response = self.client.post('/api/batch', json={'requests': items}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['responses']
+
+    def test_authenticated_get_item(self):
+        results = self.run_batch([{'id': 'me', 'method': 'GET', 'path': '/api/auth/me'}])
+        self.assertEqual(results, [{'id': 'me', 'status': 200, 'body': {'id': 7, 'email': 'a@example.com'}}])
+        self.assertEqual(self.sent, [('GET', '/auth/me', self.headers['Authorization'])])
+        self.assertTrue(all(response.closed for response in self.responses))
+
+    def test_post_item(self):
+        results = self.run_batch([{'id': 'start', 'method': 'POST', 'path': '/api/progress/lesson/3/start'}])
+        self.assertEqual(results, [{'id': 'start', 'status': 201, 'body': {'message': 'Lesson started'}}])
+        self.assertEqual(self.sent, [('POST', '/progress/lesson/3/start', self.headers['Authorization'])])
+        self.assertTrue(all(response.closed for response in self.responses))
+
+
+class BatchRateLimitTest(unittest.TestCase):
+    def test_callers_on_different_addresses_get_separate_buckets(self):
+        # Burst of 4 reads per client: the batch call itself plus its 3 items
+        admission = AdmissionController({'read': (0.001, 4)}, 100, {HIGH: 1.0, NORMAL: 1.0, LOW: 1.0})
+        catalog = mock.Mock(status_code=200, headers={'Content-Type': 'application/json'}, content=b'{"id": 1}')
+        items = [{'id': i, 'method': 'GET', 'path': f'/api/courses/{i}'} for i in range(1, 4)]
+        client = gateway.app.test_client()
+        with mock.patch.object(gateway, 'admission', admission), \
+                mock.patch.object(gateway.response_cache, 'enabled', False), \
+                mock.patch.object(gateway.upstream, 'get', return_value=catalog):
+            for address in ('10.0.0.1', '10.0.0.2'):
+                response = client.post('/api/batch', json={'requests': items}, environ_base={'REMOTE_ADDR': address})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([r['status'] for r in response.get_json()['responses']], [200, 200, 200], address)
+            # The first caller's bucket is now empty; the second caller's items did not draw from it
+            response = client.post('/api/batch', json={'requests': items[:1]}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+            self.assertEqual(response.status_code, 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
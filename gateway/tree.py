@@ -0,0 +1,65 @@
+from concurrent.futures import as_completed
+
+
+class UpstreamError(Exception):
+    """A required upstream call answered with an error status"""
+
+    def __init__(self, status, body):
+        super().__init__(body.get('error', 'Upstream error') if isinstance(body, dict) else 'Upstream error')
+        self.status = status
+        self.body = body
+
+
+def build_course_tree(executor, get_course, get_modules, get_lessons, get_quiz,
+                      course_id, include_quizzes=True, get_progress=None):
+    """Assemble course -> modules -> lessons (-> quiz, progress) in one document.
+
+    Each get_* callable returns (status, data). Independent calls are fanned
+    out on the executor: course, modules and progress together, then the
+    lessons of every module, then the quiz of every lesson as soon as its
+    module's lessons arrive.
+    """
+    course_future = executor.submit(get_course, course_id)
+    modules_future = executor.submit(get_modules, course_id)
+    progress_future = executor.submit(get_progress, course_id) if get_progress else None
+
+    course = _required(course_future.result())
+    modules = _required(modules_future.result())
+
+    lesson_futures = {executor.submit(get_lessons, m['id']): m for m in modules}
+    quiz_futures = {}
+    for future in as_completed(lesson_futures):
+        module = lesson_futures[future]
+        module['lessons'] = _required(future.result())
+        if include_quizzes:
+            for lesson in module['lessons']:
+                quiz_futures[executor.submit(get_quiz, lesson['id'])] = lesson
+
+    for future, lesson in quiz_futures.items():
+        status, data = future.result()
+        if status == 404:
+            lesson['quiz'] = None
+        else:
+            lesson['quiz'] = _required((status, data))
+
+    if progress_future:
+        progress = _required(progress_future.result())
+        statuses = {l['lesson_id']: l['status'] for l in progress['lessons']}
+        for module in modules:
+            for lesson in module['lessons']:
+                lesson['status'] = statuses.get(lesson['id'], 'not_started')
+        course['progress'] = {
+            'total_lessons': progress['total_lessons'],
+            'completed_lessons': progress['completed_lessons'],
+            'completion_percent': progress['completion_percent']
+        }
+
+    course['modules'] = modules
+    return course
+
+
+def _required(result):
+    status, data = result
+    if status != 200:
+        raise UpstreamError(status, data)
+    return data
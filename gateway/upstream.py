@@ -0,0 +1,244 @@
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeout
+from requests.adapters import HTTPAdapter
+from coalesce import SingleFlight
+from resilience import CircuitBreaker, CircuitOpenError, LatencyWindow, HedgeStats
+
+SERVICES = ('auth', 'course', 'quiz', 'progress', 'report')
+
+
+class PoolStats:
+    """Counters for one upstream connection pool (used by the sync and async clients)"""
+
+    def __init__(self, base_url, pool_size):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._requests = 0
+        self._errors = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquired(self, waited):
+        with self._lock:
+            self._requests += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            if waited > 0.001:
+                self._waits += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+    def released(self):
+        with self._lock:
+            self._in_use -= 1
+
+    def error(self):
+        with self._lock:
+            self._errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'base_url': self.base_url,
+                'pool_size': self.pool_size,
+                'in_use': self._in_use,
+                'peak_in_use': self._peak_in_use,
+                'requests': self._requests,
+                'errors': self._errors,
+                'waited_requests': self._waits,
+                'wait_avg_ms': round(self._wait_total / self._requests * 1000, 3) if self._requests else 0,
+                'wait_max_ms': round(self._wait_max * 1000, 3)
+            }
+
+
+class ServiceClient:
+    """Keep-alive HTTP client with a bounded connection pool for one upstream service"""
+
+    def __init__(self, name, base_url, pool_size, connect_timeout, read_timeout, keep_alive=True,
+                 breaker=None, metrics=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool = PoolStats(self.base_url, pool_size)
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+        self.hedging = HedgeStats()
+        self.metrics = metrics
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+        # One slot per pooled connection; waiting on a slot is waiting on the pool
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def request(self, method, path, **kwargs):
+        """Send a request through the pool.
+
+        With stream=True the pool slot stays taken until the caller closes
+        the response, since the connection is only free once the body is read.
+        Raises CircuitOpenError without touching the network while the
+        service's breaker is open.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.monotonic()
+        self._slots.acquire()
+        self.pool.acquired(time.monotonic() - started)
+
+        release_once = threading.Lock()
+        def release():
+            if release_once.acquire(blocking=False):
+                self.pool.released()
+                self._slots.release()
+
+        sent = time.monotonic()
+        try:
+            response = self.session.request(method, f'{self.base_url}{path}', **kwargs)
+        except requests.RequestException:
+            self.pool.error()
+            self.breaker.record_failure()
+            self._observe('error', sent)
+            release()
+            raise
+        except BaseException:
+            self.breaker.record_failure()
+            release()
+            raise
+
+        self._observe(response.status_code, sent)
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+            self.latency.record(time.monotonic() - sent)
+
+        if kwargs.get('stream'):
+            close = response.close
+            def close_and_release():
+                try:
+                    close()
+                finally:
+                    release()
+            response.close = close_and_release
+        else:
+            release()
+        return response
+
+    def _observe(self, status, sent):
+        if self.metrics:
+            self.metrics.observe_upstream(self.name, status, time.monotonic() - sent)
+
+    def stats(self):
+        stats = self.pool.snapshot()
+        stats['timeout_s'] = self.timeout[1]
+        stats['breaker'] = self.breaker.stats()
+        stats['hedging'] = self.hedging.stats()
+        return stats
+
+
+class Upstream:
+    """Registry of pooled clients, one per backend service"""
+
+    def __init__(self, clients, coalesce=True, hedge=False, hedge_percentile=95,
+                 hedge_min_delay=0.01, hedge_workers=32):
+        self.clients = clients
+        self.singleflight = SingleFlight(enabled=coalesce)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='hedge') if hedge else None
+
+    @classmethod
+    def from_config(cls, config, metrics=None):
+        clients = {}
+        for name in SERVICES:
+            clients[name] = ServiceClient(
+                name,
+                getattr(config, f'{name.upper()}_SERVICE'),
+                pool_size=config.UPSTREAM_POOL_SIZE,
+                connect_timeout=config.UPSTREAM_CONNECT_TIMEOUT,
+                read_timeout=getattr(config, f'{name.upper()}_SERVICE_TIMEOUT'),
+                keep_alive=config.UPSTREAM_KEEP_ALIVE,
+                breaker=CircuitBreaker(config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RESET_TIMEOUT),
+                metrics=metrics
+            )
+        return cls(
+            clients,
+            coalesce=config.COALESCE_ENABLED,
+            hedge=config.HEDGE_ENABLED,
+            hedge_percentile=config.HEDGE_PERCENTILE,
+            hedge_min_delay=config.HEDGE_MIN_DELAY_MS / 1000,
+            hedge_workers=config.HEDGE_WORKERS
+        )
+
+    def request(self, service, method, path, **kwargs):
+        return self.clients[service].request(method, path, **kwargs)
+
+    def get(self, service, path, **kwargs):
+        # Identical in-flight GETs that carry no credentials share one upstream call
+        headers = kwargs.get('headers') or {}
+        if 'Authorization' in headers or kwargs.get('stream'):
+            return self._get(service, path, **kwargs)
+        key = (
+            service, path,
+            tuple(sorted((kwargs.get('params') or {}).items())),
+            tuple(sorted(headers.items()))
+        )
+        return self.singleflight.do(service, key, lambda: self._get(service, path, **kwargs))
+
+    def _get(self, service, path, **kwargs):
+        """GET, hedged with a second attempt once the first outlives the service's p95"""
+        client = self.clients[service]
+        delay = client.latency.percentile(self.hedge_percentile) if self.hedge and not kwargs.get('stream') else None
+        if delay is None:
+            return client.request('GET', path, **kwargs)
+
+        primary = self._hedge_executor.submit(client.request, 'GET', path, **kwargs)
+        try:
+            response = primary.result(timeout=max(delay, self.hedge_min_delay))
+            client.hedging.record(fired=False, hedge_won=False)
+            return response
+        except FutureTimeout:
+            pass
+        except Exception:
+            client.hedging.record(fired=False, hedge_won=False)
+            raise
+
+        if client.breaker.state != CircuitBreaker.CLOSED:
+            client.hedging.record(fired=False, hedge_won=False)
+            return primary.result()
+
+        backup = self._hedge_executor.submit(client.request, 'GET', path, **kwargs)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    client.hedging.record(fired=True, hedge_won=future is backup)
+                    return future.result()
+                error = future.exception()
+        client.hedging.record(fired=True, hedge_won=False)
+        raise error
+
+    def post(self, service, path, **kwargs):
+        return self.request(service, 'POST', path, **kwargs)
+
+    def stats(self):
+        return {name: client.stats() for name, client in self.clients.items()}
+
+    def coalescing_stats(self):
+        return self.singleflight.stats()
@@ -0,0 +1,13 @@
+-- Runs once on the replica container's first start (docker-compose.replica.yml).
+-- The schema arrives through replication, so schema.sql is not loaded here.
+CHANGE REPLICATION SOURCE TO
+    SOURCE_HOST = 'mysql',
+    SOURCE_PORT = 3306,
+    SOURCE_USER = 'root',
+    SOURCE_PASSWORD = 'password',
+    SOURCE_AUTO_POSITION = 1,
+    GET_SOURCE_PUBLIC_KEY = 1;
+START REPLICA;
+
+-- Persisted so it also applies after the entrypoint restarts the server
+SET PERSIST super_read_only = ON;
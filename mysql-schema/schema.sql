@@ -78,6 +78,16 @@ CREATE TABLE progress (
     INDEX idx_status (status)
 );
 
+-- Idempotency keys of POST /progress/events calls, with the response to replay
+CREATE TABLE progress_idempotency_keys (
+    user_id INT NOT NULL,
+    idempotency_key VARCHAR(100) NOT NULL,
+    response TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, idempotency_key),
+    INDEX idx_created_at (created_at)
+);
+
 -- Quizzes table
 CREATE TABLE quizzes (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -113,6 +123,7 @@ CREATE TABLE choices (
     is_correct BOOLEAN DEFAULT FALSE,
     order_index INT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE,
     INDEX idx_question_id (question_id),
     UNIQUE KEY unique_question_order (question_id, order_index)
@@ -128,9 +139,11 @@ CREATE TABLE quiz_attempts (
     correct_answers INT,
     started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     finished_at TIMESTAMP NULL,
+    submission_id CHAR(32) NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (quiz_id) REFERENCES quizzes(id) ON DELETE CASCADE,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    UNIQUE KEY unique_submission (submission_id),
     INDEX idx_quiz_id (quiz_id),
     INDEX idx_user_id (user_id),
     INDEX idx_finished_at (finished_at)
@@ -183,6 +196,54 @@ CREATE TABLE reports (
     INDEX idx_report_date (report_date)
 );
 
+-- Per-(user, quiz) attempt summary, updated with each submission
+CREATE TABLE quiz_user_summary (
+    user_id INT NOT NULL,
+    quiz_id INT NOT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    best_score DECIMAL(5, 2),
+    last_score DECIMAL(5, 2),
+    last_attempt_at TIMESTAMP NULL,
+    PRIMARY KEY (user_id, quiz_id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (quiz_id) REFERENCES quizzes(id) ON DELETE CASCADE,
+    INDEX idx_quiz_id (quiz_id)
+);
+
+-- Item analysis: running sums per quiz, question and choice, advanced
+-- incrementally by quiz-service/item_analysis.py
+CREATE TABLE quiz_analysis_state (
+    quiz_id INT PRIMARY KEY,
+    last_attempt_id INT NOT NULL DEFAULT 0,
+    attempts INT NOT NULL DEFAULT 0,
+    sum_total DOUBLE NOT NULL DEFAULT 0,
+    sum_total_sq DOUBLE NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (quiz_id) REFERENCES quizzes(id) ON DELETE CASCADE
+);
+
+CREATE TABLE quiz_item_stats (
+    quiz_id INT NOT NULL,
+    question_id INT NOT NULL,
+    answers INT NOT NULL DEFAULT 0,
+    correct INT NOT NULL DEFAULT 0,
+    sum_total DOUBLE NOT NULL DEFAULT 0,
+    sum_total_sq DOUBLE NOT NULL DEFAULT 0,
+    sum_correct_total DOUBLE NOT NULL DEFAULT 0,
+    PRIMARY KEY (quiz_id, question_id),
+    FOREIGN KEY (quiz_id) REFERENCES quizzes(id) ON DELETE CASCADE,
+    FOREIGN KEY (question_id) REFERENCES questions(id) ON DELETE CASCADE
+);
+
+CREATE TABLE quiz_choice_stats (
+    quiz_id INT NOT NULL,
+    choice_id INT NOT NULL,
+    selections INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (quiz_id, choice_id),
+    FOREIGN KEY (quiz_id) REFERENCES quizzes(id) ON DELETE CASCADE,
+    FOREIGN KEY (choice_id) REFERENCES choices(id) ON DELETE CASCADE
+);
+
 -- Create indexes for common queries
 CREATE INDEX idx_progress_user_status ON progress(user_id, status);
 CREATE INDEX idx_quiz_attempts_user_quiz ON quiz_attempts(user_id, quiz_id);
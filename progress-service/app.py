@@ -1,77 +1,75 @@
+import json
+import time
+import mysql.connector
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 from config import Config
-from database import get_db
-import jwt
-from datetime import datetime
+import database
+from database import get_db, pool, replicas, read_only
+import dal
+from query_trace import tracer
+import queries
+from metrics import Metrics, stats_collector
+from compression import Compressor
+from auth_middleware import token_required, token_cache
+from datetime import datetime, timezone
 
 load_dotenv()
 app = Flask(__name__)
 CORS(app)
 app.config.from_object(Config)
+metrics = Metrics('progress-service')
+metrics.init_app(app)
+compressor = Compressor.from_config(Config)
+compressor.init_app(app)
+database.init_app(app)
+tracer.init_app(app)
+metrics.register_collector(stats_collector('token_cache', token_cache.stats))
+metrics.register_collector(stats_collector('compression', compressor.route_stats, label='route'))
+metrics.register_collector(stats_collector('db_pool', pool.stats))
+metrics.register_collector(stats_collector('db_replica', replicas.replica_stats, label='replica'))
+metrics.register_collector(stats_collector('db_reads', replicas.routing_stats))
+metrics.register_collector(stats_collector('query', dal.query_stats.stats, label='query'))
+metrics.register_collector(stats_collector('query_trace', tracer.route_stats, label='route'))
 
 # Health check
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'service': 'progress-service'}), 200
 
+# Runtime stats
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'token_cache': token_cache.stats(),
+        'compression': compressor.stats(),
+        'db_pool': pool.stats(),
+        'db_replicas': replicas.replica_stats(),
+        'db_reads': replicas.routing_stats(),
+        'queries': dal.query_stats.stats(),
+        'query_trace': tracer.stats()
+    }), 200
+
 # Get user's overall progress
 @app.route('/progress', methods=['GET'])
-def get_user_progress():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+@read_only
+def get_user_progress(payload):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        db = get_db()
-        cursor = db.cursor()
-        
         # Get all lessons user is enrolled in
-        cursor.execute(
-            '''SELECT p.id, p.lesson_id, p.status, l.title, m.id, c.id, c.title, p.completed_at
-               FROM progress p
-               JOIN lessons l ON p.lesson_id = l.id
-               JOIN modules m ON l.module_id = m.id
-               JOIN courses c ON m.course_id = c.id
-               WHERE p.user_id = %s
-               ORDER BY c.id, m.order_index, l.order_index''',
-            (payload['user_id'],)
-        )
-        progress_records = cursor.fetchall()
-        cursor.close()
-        
-        result = [
-            {
-                'id': p[0],
-                'lesson_id': p[1],
-                'status': p[2],
-                'lesson_title': p[3],
-                'module_id': p[4],
-                'course_id': p[5],
-                'course_title': p[6],
-                'completed_at': str(p[7]) if p[7] else None
-            } for p in progress_records
-        ]
+        result = dal.fetch_all(queries.USER_PROGRESS, (payload['user_id'],))
         
         return jsonify(result), 200
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Get progress for specific course
 @app.route('/progress/course/<int:course_id>', methods=['GET'])
-def get_course_progress(course_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+@read_only
+def get_course_progress(payload, course_id):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
         db = get_db()
         cursor = db.cursor()
         
@@ -119,74 +117,145 @@ def get_course_progress(course_id):
                 } for l in lessons
             ]
         }), 200
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Mark lesson as started/in progress
 @app.route('/progress/lesson/<int:lesson_id>/start', methods=['POST'])
-def start_lesson(lesson_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+def start_lesson(payload, lesson_id):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
         db = get_db()
-        cursor = db.cursor()
-        
-        # Create or update progress
-        cursor.execute(
-            'SELECT id FROM progress WHERE user_id = %s AND lesson_id = %s',
-            (payload['user_id'], lesson_id)
-        )
-        progress = cursor.fetchone()
-        
-        if progress:
-            cursor.execute(
-                'UPDATE progress SET status = %s, started_at = NOW() WHERE id = %s',
-                ('in_progress', progress[0])
-            )
-        else:
-            cursor.execute(
-                'INSERT INTO progress (user_id, lesson_id, status, started_at) VALUES (%s, %s, %s, NOW())',
-                (payload['user_id'], lesson_id, 'in_progress')
-            )
-        
+        dal.execute(queries.START_LESSON, (payload['user_id'], lesson_id), db)
         db.commit()
-        cursor.close()
         
         return jsonify({'message': 'Lesson started'}), 200
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Mark lesson as completed
 @app.route('/progress/lesson/<int:lesson_id>/complete', methods=['POST'])
-def complete_lesson(lesson_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+def complete_lesson(payload, lesson_id):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
         db = get_db()
-        cursor = db.cursor()
-        
-        cursor.execute(
-            'UPDATE progress SET status = %s, completed_at = NOW() WHERE user_id = %s AND lesson_id = %s',
-            ('completed', payload['user_id'], lesson_id)
-        )
+        # Creates the row if the lesson was never started
+        dal.execute(queries.COMPLETE_LESSON, (payload['user_id'], lesson_id), db)
         db.commit()
-        cursor.close()
         
         return jsonify({'message': 'Lesson completed'}), 200
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def client_time(value, now):
+    """An event's client_timestamp (ISO 8601 or epoch seconds/ms) as naive UTC, never later than now"""
+    if value is None:
+        return now
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        stamp = datetime.fromtimestamp(value / 1000 if value > 1e11 else value, timezone.utc)
+    else:
+        stamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        if stamp.tzinfo is None:
+            stamp = stamp.replace(tzinfo=timezone.utc)
+    return min(stamp.astimezone(timezone.utc).replace(tzinfo=None, microsecond=0), now)
+
+last_key_cleanup = 0.0
+
+def expire_idempotency_keys(db):
+    """Delete keys older than PROGRESS_IDEMPOTENCY_TTL, at most once a minute per process.
+
+    Runs after a batch has committed, so a failure here is logged rather
+    than turning that batch's response into an error.
+    """
+    global last_key_cleanup
+    if time.monotonic() - last_key_cleanup < 60:
+        return
+    last_key_cleanup = time.monotonic()
+    try:
+        dal.execute(queries.DELETE_EXPIRED_IDEMPOTENCY_KEYS, (Config.PROGRESS_IDEMPOTENCY_TTL,), db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        app.logger.exception('Expiring idempotency keys failed')
+
+# Record a batch of lesson start/complete events
+@app.route('/progress/events', methods=['POST'])
+@token_required
+def record_events(payload):
+    """Apply many {lesson_id, event, client_timestamp} items in one transaction.
+
+    Events are folded per lesson and written with one multi-row upsert. A
+    retry carrying the same Idempotency-Key header gets the first call's
+    response without touching progress again.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        events = data.get('events')
+        if not isinstance(events, list) or not events:
+            return jsonify({'error': 'Missing events'}), 400
+        if len(events) > Config.PROGRESS_BATCH_MAX_EVENTS:
+            return jsonify({'error': f'At most {Config.PROGRESS_BATCH_MAX_EVENTS} events per request'}), 400
+        
+        db = get_db()
+        # Client times are UTC; store them on the session clock NOW() uses for
+        # the single start/complete calls, so "later wins" compares like with like
+        utc_now, now = dal.fetch_rows(queries.SESSION_CLOCK, (), db)[0]
+        offset = now - utc_now
+        lessons = {}
+        for i, event in enumerate(events):
+            try:
+                lesson_id = event['lesson_id']
+                kind = event['event']
+                if not isinstance(lesson_id, int) or isinstance(lesson_id, bool) or kind not in ('start', 'complete'):
+                    raise ValueError(event)
+                at = client_time(event.get('client_timestamp'), utc_now) + offset
+            except (KeyError, TypeError, ValueError, OverflowError, OSError):
+                return jsonify({'error': f'Invalid event at index {i}'}), 400
+            started, completed = lessons.get(lesson_id, (None, None))
+            if kind == 'start':
+                started = max(started or at, at)
+            else:
+                completed = max(completed or at, at)
+            lessons[lesson_id] = (started, completed)
+        
+        user_id = payload['user_id']
+        key = request.headers.get('Idempotency-Key')
+        if key is not None and not 0 < len(key) <= 100:
+            return jsonify({'error': 'Idempotency-Key must be 1-100 characters'}), 400
+        
+        if key:
+            try:
+                dal.execute(queries.INSERT_IDEMPOTENCY_KEY, (user_id, key), db)
+            except mysql.connector.IntegrityError:
+                # Already applied (the key row only becomes visible once that call committed)
+                db.rollback()
+                stored = dal.fetch_rows(queries.IDEMPOTENCY_RESPONSE, (user_id, key), db)
+                response = jsonify(json.loads(stored[0][0]) if stored and stored[0][0] else {})
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response, 200
+        
+        rows = [
+            (user_id, lesson_id,
+             'completed' if completed and (not started or completed >= started) else 'in_progress',
+             started, completed)
+            for lesson_id, (started, completed) in lessons.items()
+        ]
+        try:
+            dal.upsert_many('progress_events', 'progress', queries.EVENT_COLUMNS, rows, queries.EVENT_UPDATES, db)
+        except mysql.connector.IntegrityError:
+            db.rollback()
+            return jsonify({'error': 'Unknown lesson id in events'}), 400
+        
+        result = {'events': len(events), 'lessons': len(rows)}
+        if key:
+            dal.execute(queries.SAVE_IDEMPOTENCY_RESPONSE, (json.dumps(result), user_id, key), db)
+        db.commit()
+        if key:
+            expire_idempotency_keys(db)
+        
+        return jsonify(result), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import OrderedDict
+from database import get_db
+
+
+# Row value converters, matching how handlers have always rendered these columns
+def to_str(value):
+    return str(value)
+
+
+def str_or_none(value):
+    return str(value) if value else None
+
+
+def float_or_zero(value):
+    return float(value) if value else 0
+
+
+def float_or_none(value):
+    return float(value) if value else None
+
+
+class Query:
+    """Named SQL statement plus the dict its rows map to.
+
+    `columns` lists the result columns in SELECT order, each either a key
+    name or a (key, converter) pair, e.g. ('id', ('created_at', to_str)).
+    """
+
+    __slots__ = ('name', 'sql', 'keys', 'converters', 'prepared')
+
+    def __init__(self, name, sql, columns=(), prepared=True):
+        self.name = name
+        self.sql = sql
+        self.keys = tuple(c if isinstance(c, str) else c[0] for c in columns)
+        self.converters = tuple(None if isinstance(c, str) else c[1] for c in columns)
+        self.prepared = prepared
+
+    def map_row(self, row):
+        return {
+            key: convert(value) if convert else value
+            for key, convert, value in zip(self.keys, self.converters, row)
+        }
+
+
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = {}
+
+    def record(self, name, seconds, rows):
+        with self._lock:
+            stats = self._queries.get(name)
+            if stats is None:
+                stats = self._queries[name] = {'calls': 0, 'rows': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            stats['calls'] += 1
+            stats['rows'] += rows
+            stats['total_ms'] += seconds * 1000
+            stats['max_ms'] = max(stats['max_ms'], seconds * 1000)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: dict(
+                    stats,
+                    total_ms=round(stats['total_ms'], 3),
+                    max_ms=round(stats['max_ms'], 3),
+                    avg_ms=round(stats['total_ms'] / stats['calls'], 3)
+                )
+                for name, stats in self._queries.items()
+            }
+
+
+query_stats = QueryStats()
+
+# Server-side prepared statements are cached per pooled connection, one cursor
+# per query name, so MySQL parses each statement once per connection
+MAX_PREPARED_PER_CONNECTION = 64
+
+
+def _cursor(db, query):
+    if not query.prepared:
+        return db.cursor(), True
+    # A connection is only ever used by one thread at a time, so no lock
+    cursors = getattr(db, 'prepared_cursors', None)
+    if cursors is None:
+        cursors = db.prepared_cursors = OrderedDict()
+    cursor = cursors.get(query.name)
+    if cursor is None:
+        cursor = cursors[query.name] = db.cursor(prepared=True)
+        if len(cursors) > MAX_PREPARED_PER_CONNECTION:
+            _, evicted = cursors.popitem(last=False)
+            evicted.close()
+    else:
+        cursors.move_to_end(query.name)
+    return cursor, False
+
+
+def _forget(db, query):
+    cursor = db.prepared_cursors.pop(query.name, None)
+    if cursor is not None:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+
+def _run(query, params, db, fetch):
+    db = db or get_db()
+    cursor, owned = _cursor(db, query)
+    count = 0
+    started = time.perf_counter()
+    try:
+        cursor.execute(query.sql, params)
+        if fetch:
+            result = cursor.fetchall()
+            count = len(result)
+        else:
+            result = (cursor.rowcount, cursor.lastrowid)
+            count = max(cursor.rowcount, 0)
+        return result
+    except Exception:
+        # A failed statement may leave unread results behind; prepare afresh next time
+        if not owned:
+            _forget(db, query)
+        raise
+    finally:
+        query_stats.record(query.name, time.perf_counter() - started, count)
+        if owned:
+            cursor.close()
+
+
+def fetch_all(query, params=(), db=None):
+    """Run a SELECT and map every row to a dict"""
+    return [query.map_row(row) for row in _run(query, params, db, fetch=True)]
+
+
+def fetch_one(query, params=(), db=None):
+    """Run a SELECT and map its first row, or return None"""
+    rows = _run(query, params, db, fetch=True)
+    return query.map_row(rows[0]) if rows else None
+
+
+def fetch_rows(query, params=(), db=None):
+    """Run a SELECT and return the raw tuples"""
+    return _run(query, params, db, fetch=True)
+
+
+def execute(query, params=(), db=None):
+    """Run a write; returns (rowcount, lastrowid). The caller commits."""
+    return _run(query, params, db, fetch=False)
+
+
+def execute_many(query, rows, db=None):
+    """Run one statement for many parameter rows.
+
+    Uses a plain cursor: mysql-connector rewrites an INSERT ... VALUES
+    executemany into a single multi-row INSERT, which beats re-executing a
+    prepared statement per row.
+    """
+    if not rows:
+        return 0
+    db = db or get_db()
+    cursor = db.cursor()
+    started = time.perf_counter()
+    try:
+        cursor.executemany(query.sql, rows)
+        return cursor.rowcount
+    finally:
+        query_stats.record(query.name, time.perf_counter() - started, len(rows))
+        cursor.close()
+
+
+def upsert_many(name, table, columns, rows, update_columns, db=None, chunk_size=500):
+    """Multi-row INSERT ... ON DUPLICATE KEY UPDATE, `chunk_size` rows per statement.
+
+    `update_columns` entries are column names (set to the inserted value) or
+    (column, SQL expression) pairs. Returns the summed rowcount (MySQL counts
+    1 per inserted row and 2 per updated one).
+    """
+    if not rows:
+        return 0
+    db = db or get_db()
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    updates = ', '.join(f'{c} = VALUES({c})' if isinstance(c, str) else f'{c[0]} = {c[1]}' for c in update_columns)
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    cursor = db.cursor()
+    affected = 0
+    started = time.perf_counter()
+    try:
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            sql = prefix + ', '.join([placeholders] * len(chunk)) + ' ON DUPLICATE KEY UPDATE ' + updates
+            cursor.execute(sql, [value for row in chunk for value in row])
+            affected += cursor.rowcount
+        return affected
+    finally:
+        query_stats.record(name, time.perf_counter() - started, len(rows))
+        cursor.close()
@@ -0,0 +1,63 @@
+from dal import Query, str_or_none
+
+USER_PROGRESS = Query(
+    'user_progress',
+    '''SELECT p.id, p.lesson_id, p.status, l.title, m.id, c.id, c.title, p.completed_at
+       FROM progress p
+       JOIN lessons l ON p.lesson_id = l.id
+       JOIN modules m ON l.module_id = m.id
+       JOIN courses c ON m.course_id = c.id
+       WHERE p.user_id = %s
+       ORDER BY c.id, m.order_index, l.order_index''',
+    ('id', 'lesson_id', 'status', 'lesson_title', 'module_id', 'course_id', 'course_title',
+     ('completed_at', str_or_none))
+)
+
+# Single events: one atomic upsert on unique_user_lesson each
+START_LESSON = Query(
+    'start_lesson',
+    '''INSERT INTO progress (user_id, lesson_id, status, started_at) VALUES (%s, %s, 'in_progress', NOW())
+       ON DUPLICATE KEY UPDATE status = 'in_progress', started_at = NOW()'''
+)
+
+COMPLETE_LESSON = Query(
+    'complete_lesson',
+    '''INSERT INTO progress (user_id, lesson_id, status, completed_at) VALUES (%s, %s, 'completed', NOW())
+       ON DUPLICATE KEY UPDATE status = 'completed', completed_at = NOW()'''
+)
+
+# The session clock (what NOW() writes above) and UTC, so client timestamps
+# sent in UTC can be stored on the same clock as the single-event upserts
+SESSION_CLOCK = Query('session_clock', 'SELECT UTC_TIMESTAMP(), NOW()')
+
+# Batched events are merged into existing rows by client time: the later of
+# the stored and new timestamps wins, then status follows whichever of
+# started_at / completed_at is newer. Assignments run left to right, so
+# status sees the merged timestamps.
+EVENT_COLUMNS = ('user_id', 'lesson_id', 'status', 'started_at', 'completed_at')
+EVENT_UPDATES = (
+    ('started_at', 'GREATEST(COALESCE(started_at, VALUES(started_at)), COALESCE(VALUES(started_at), started_at))'),
+    ('completed_at', 'GREATEST(COALESCE(completed_at, VALUES(completed_at)), COALESCE(VALUES(completed_at), completed_at))'),
+    ('status', "IF(completed_at IS NOT NULL AND (started_at IS NULL OR completed_at >= started_at), 'completed', "
+               "IF(started_at IS NOT NULL, 'in_progress', status))")
+)
+
+INSERT_IDEMPOTENCY_KEY = Query(
+    'insert_idempotency_key',
+    'INSERT INTO progress_idempotency_keys (user_id, idempotency_key) VALUES (%s, %s)'
+)
+
+SAVE_IDEMPOTENCY_RESPONSE = Query(
+    'save_idempotency_response',
+    'UPDATE progress_idempotency_keys SET response = %s WHERE user_id = %s AND idempotency_key = %s'
+)
+
+IDEMPOTENCY_RESPONSE = Query(
+    'idempotency_response',
+    'SELECT response FROM progress_idempotency_keys WHERE user_id = %s AND idempotency_key = %s'
+)
+
+DELETE_EXPIRED_IDEMPOTENCY_KEYS = Query(
+    'delete_expired_idempotency_keys',
+    'DELETE FROM progress_idempotency_keys WHERE created_at < NOW() - INTERVAL %s SECOND LIMIT 1000'
+)
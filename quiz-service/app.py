@@ -1,135 +1,224 @@
+import math
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 from config import Config
-from database import get_db
-import jwt
+import database
+from database import get_db, pool, replicas, read_only
+import dal
+from query_trace import tracer
+import queries
+from metrics import Metrics, stats_collector
+from compression import Compressor
+from auth_middleware import token_required, token_cache
+from conditional import make_etag, last_modified, not_modified, with_validators
+from quiz_cache import QuizCache, InvalidAnswers, load_quiz, quiz_version, quizzes_for_rows, version_updated_at
+from ingest import IngestQueue, QueueFull
+import item_analysis
 
 load_dotenv()
 app = Flask(__name__)
 CORS(app)
 app.config.from_object(Config)
+metrics = Metrics('quiz-service')
+metrics.init_app(app)
+compressor = Compressor.from_config(Config)
+compressor.init_app(app)
+database.init_app(app)
+tracer.init_app(app)
+quiz_cache = QuizCache(Config.QUIZ_CACHE_SIZE)
+ingest = IngestQueue.from_config(Config)
+if Config.INGEST_WRITE_BEHIND:
+    ingest.start()
+metrics.register_collector(stats_collector('token_cache', token_cache.stats))
+metrics.register_collector(stats_collector('compression', compressor.route_stats, label='route'))
+metrics.register_collector(stats_collector('db_pool', pool.stats))
+metrics.register_collector(stats_collector('db_replica', replicas.replica_stats, label='replica'))
+metrics.register_collector(stats_collector('db_reads', replicas.routing_stats))
+metrics.register_collector(stats_collector('query', dal.query_stats.stats, label='query'))
+metrics.register_collector(stats_collector('query_trace', tracer.route_stats, label='route'))
+metrics.register_collector(stats_collector('quiz_cache', quiz_cache.stats))
+metrics.register_collector(stats_collector('ingest', ingest.stats))
 
 # Health check
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'service': 'quiz-service'}), 200
 
+# Runtime stats
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'token_cache': token_cache.stats(),
+        'compression': compressor.stats(),
+        'db_pool': pool.stats(),
+        'db_replicas': replicas.replica_stats(),
+        'db_reads': replicas.routing_stats(),
+        'queries': dal.query_stats.stats(),
+        'query_trace': tracer.stats(),
+        'quiz_cache': quiz_cache.stats(),
+        'ingest': ingest.stats()
+    }), 200
+
 # Get quiz by lesson ID
 @app.route('/quizzes/lesson/<int:lesson_id>', methods=['GET'])
+@read_only
 def get_quiz_by_lesson(lesson_id):
     try:
-        db = get_db()
-        cursor = db.cursor()
-        
-        cursor.execute(
-            'SELECT id, title, passing_score, max_attempts FROM quizzes WHERE lesson_id = %s',
-            (lesson_id,)
-        )
-        quiz = cursor.fetchone()
+        # One query for the quiz and its version, enough to answer a 304;
+        # questions and choices are read in one more only when the compiled
+        # copy is missing or stale
+        rows = dal.fetch_rows(queries.QUIZ_BY_LESSON, (lesson_id,))
         
-        if not quiz:
+        if not rows:
             return jsonify({'error': 'Quiz not found'}), 404
         
-        # Get questions
-        cursor.execute(
-            'SELECT id, prompt, type, order_index FROM questions WHERE quiz_id = %s ORDER BY order_index',
-            (quiz[0],)
-        )
-        questions = cursor.fetchall()
+        quiz_id, version = quiz_version(rows[0])
+        etag = make_etag('quiz', quiz_id, *version)
+        modified = last_modified(*version_updated_at(version))
+        unchanged = not_modified(etag, modified)
+        if unchanged:
+            return unchanged
         
-        questions_data = []
-        for q in questions:
-            cursor.execute(
-                'SELECT id, text, order_index FROM choices WHERE question_id = %s ORDER BY order_index',
-                (q[0],)
-            )
-            choices = cursor.fetchall()
-            
-            questions_data.append({
-                'id': q[0],
-                'prompt': q[1],
-                'type': q[2],
-                'order_index': q[3],
-                'choices': [{'id': c[0], 'text': c[1], 'order_index': c[2]} for c in choices]
-            })
-        
-        cursor.close()
+        quiz = quizzes_for_rows(quiz_cache, rows)[0]
+        return with_validators(jsonify(quiz.payload), etag, modified), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def bulk_quizzes(query, params):
+    """Every quiz a set-based query finds, with its lesson id, in at most two queries.
+
+    ?questions=false returns quiz headers only; ?choices=false omits choices.
+    """
+    include_questions = request.args.get('questions', 'true').lower() != 'false'
+    include_choices = request.args.get('choices', 'true').lower() != 'false'
+    rows = dal.fetch_rows(query, params)
+    
+    # The ETag needs only ids and versions, so a matching If-None-Match is
+    # answered before any question or choice is read
+    etag = make_etag('quizzes', include_questions, include_choices, *[quiz_version(row) for row in rows])
+    unchanged = not_modified(etag)
+    if unchanged:
+        return unchanged
+    
+    quizzes = quizzes_for_rows(quiz_cache, rows, content=include_questions)
+    result = []
+    for quiz in quizzes:
+        data = dict(quiz.payload, lesson_id=quiz.lesson_id)
+        if not include_questions:
+            del data['questions']
+        elif not include_choices:
+            data['questions'] = [{k: v for k, v in q.items() if k != 'choices'} for q in data['questions']]
+        result.append(data)
+    return with_validators(jsonify(result), etag), 200
+
+# Get quizzes for a list of lessons
+@app.route('/quizzes/lessons', methods=['GET'])
+@read_only
+def get_quizzes_by_lessons():
+    try:
+        try:
+            lesson_ids = sorted({int(i) for i in request.args.get('ids', '').split(',') if i.strip()})
+        except ValueError:
+            return jsonify({'error': 'ids must be comma separated lesson ids'}), 400
+        if not lesson_ids:
+            return jsonify({'error': 'Missing ids'}), 400
+        if len(lesson_ids) > Config.QUIZ_BULK_MAX_LESSONS:
+            return jsonify({'error': f'At most {Config.QUIZ_BULK_MAX_LESSONS} lesson ids per request'}), 400
         
-        return jsonify({
-            'id': quiz[0],
-            'title': quiz[1],
-            'passing_score': quiz[2],
-            'max_attempts': quiz[3],
-            'questions': questions_data
-        }), 200
+        return bulk_quizzes(queries.quizzes_by_lessons(len(lesson_ids)), lesson_ids)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Get every quiz in a module
+@app.route('/quizzes/module/<int:module_id>', methods=['GET'])
+@read_only
+def get_quizzes_by_module(module_id):
+    try:
+        return bulk_quizzes(queries.QUIZZES_BY_MODULE, (module_id,))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Get every quiz in a course
+@app.route('/quizzes/course/<int:course_id>', methods=['GET'])
+@read_only
+def get_quizzes_by_course(course_id):
+    try:
+        return bulk_quizzes(queries.QUIZZES_BY_COURSE, (course_id,))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Submit quiz attempt
 @app.route('/quizzes/<int:quiz_id>/attempts', methods=['POST'])
-def submit_attempt(quiz_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+def submit_attempt(payload, quiz_id):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
         data = request.get_json()
         
         if not data or 'answers' not in data:
             return jsonify({'error': 'Missing answers'}), 400
         
         db = get_db()
-        cursor = db.cursor()
-        
-        # Create attempt record
-        cursor.execute(
-            'INSERT INTO quiz_attempts (quiz_id, user_id, started_at, finished_at) VALUES (%s, %s, NOW(), NOW())',
-            (quiz_id, payload['user_id'])
-        )
-        db.commit()
-        attempt_id = cursor.lastrowid
-        
-        # Process answers
-        correct_count = 0
-        total_count = 0
-        
-        for answer in data['answers']:
-            question_id = answer.get('question_id')
-            choice_id = answer.get('choice_id')
-            
-            # Check if correct
-            cursor.execute(
-                'SELECT is_correct FROM choices WHERE id = %s AND question_id = %s',
-                (choice_id, question_id)
-            )
-            choice = cursor.fetchone()
-            is_correct = choice[0] if choice else False
-            
-            # Record answer
-            cursor.execute(
-                'INSERT INTO attempt_answers (attempt_id, question_id, choice_id, is_correct) VALUES (%s, %s, %s, %s)',
-                (attempt_id, question_id, choice_id, is_correct)
-            )
-            
-            if is_correct:
-                correct_count += 1
-            total_count += 1
         
-        db.commit()
-        
-        # Calculate score
+        # Grade against the cached answer key (read from the primary, so an
+        # edit made just before is seen)
+        quiz = load_quiz(quiz_cache, queries.QUIZ_BY_ID, quiz_id, db)
+        if not quiz:
+            return jsonify({'error': 'Quiz not found'}), 404
+        try:
+            graded, correct_count = quiz.grade(data['answers'])
+        except InvalidAnswers as e:
+            return jsonify({'error': str(e)}), 400
+        total_count = len(graded)
         score = (correct_count / total_count * 100) if total_count > 0 else 0
+        max_attempts = quiz.payload['max_attempts']
         
-        # Update attempt with results
-        cursor.execute(
-            'UPDATE quiz_attempts SET score = %s, total_questions = %s, correct_answers = %s WHERE id = %s',
-            (score, total_count, correct_count, attempt_id)
+        if ingest.enabled:
+            # Journaled locally; the attempt row is written in a later batch.
+            # grade() has already rejected answers the foreign keys would,
+            # so a 202 means the writer will accept the attempt.
+            # The limit check counts this process's queued attempts but is not
+            # transactional with the write.
+            if max_attempts:
+                summary = dal.fetch_rows(queries.USER_SUMMARY_ATTEMPTS, (payload['user_id'], quiz_id), db)
+                taken = (summary[0][0] if summary else 0) + ingest.pending_attempts(payload['user_id'], quiz_id)
+                if taken >= max_attempts:
+                    return jsonify({'error': 'Maximum attempts reached'}), 403
+            try:
+                submission_id = ingest.submit(quiz_id, payload['user_id'], score, total_count, correct_count, graded)
+            except QueueFull as e:
+                response = jsonify({'error': str(e)})
+                response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+                return response, 503
+            return jsonify({
+                'attempt_id': None,
+                'submission_id': submission_id,
+                'queued': True,
+                'score': score,
+                'correct_answers': correct_count,
+                'total_questions': total_count
+            }), 202
+        
+        # The summary row, the attempt with its final score and every answer,
+        # in one transaction. Updating the summary first locks it, so
+        # concurrent submissions by the same user are counted one at a time.
+        dal.execute(queries.RECORD_USER_SUMMARY, (payload['user_id'], quiz_id, score, score), db)
+        if max_attempts:
+            attempts = dal.fetch_rows(queries.USER_SUMMARY_ATTEMPTS, (payload['user_id'], quiz_id), db)[0][0]
+            if attempts > max_attempts:
+                db.rollback()
+                return jsonify({'error': 'Maximum attempts reached'}), 403
+        _, attempt_id = dal.execute(
+            queries.INSERT_ATTEMPT,
+            (quiz_id, payload['user_id'], score, total_count, correct_count),
+            db
+        )
+        dal.execute_many(
+            queries.INSERT_ATTEMPT_ANSWERS,
+            [(attempt_id, question_id, choice_id, is_correct) for question_id, choice_id, is_correct in graded],
+            db
         )
         db.commit()
-        cursor.close()
         
         return jsonify({
             'attempt_id': attempt_id,
@@ -137,45 +226,69 @@ def submit_attempt(quiz_id):
             'correct_answers': correct_count,
             'total_questions': total_count
         }), 201
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Get user's quiz attempts
 @app.route('/quizzes/<int:quiz_id>/attempts/user', methods=['GET'])
-def get_user_attempts(quiz_id):
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+@read_only
+def get_user_attempts(payload, quiz_id):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        result = dal.fetch_all(queries.USER_ATTEMPTS, (quiz_id, payload['user_id']))
+        
+        return jsonify(result), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Get the user's status on every quiz in a course
+@app.route('/quizzes/course/<int:course_id>/status', methods=['GET'])
+@token_required
+@read_only
+def get_course_quiz_status(payload, course_id):
+    try:
+        quizzes = dal.fetch_all(queries.COURSE_QUIZ_STATUS, (payload['user_id'], course_id))
+        
+        for quiz in quizzes:
+            quiz['attempts_remaining'] = (
+                max(quiz['max_attempts'] - quiz['attempts'], 0) if quiz['max_attempts'] else None
+            )
+            quiz['passed'] = quiz['best_score'] is not None and quiz['best_score'] >= quiz['passing_score']
+        
+        return jsonify(quizzes), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Item analysis for a quiz (instructors)
+@app.route('/quizzes/<int:quiz_id>/analysis', methods=['GET'])
+@token_required
+@read_only
+def get_quiz_analysis(payload, quiz_id):
+    try:
+        if payload['role'] not in ['admin', 'instructor']:
+            return jsonify({'error': 'Unauthorized'}), 403
+        
         db = get_db()
-        cursor = db.cursor()
+        quiz = load_quiz(quiz_cache, queries.QUIZ_BY_ID, quiz_id, db)
+        if not quiz:
+            return jsonify({'error': 'Quiz not found'}), 404
         
-        cursor.execute(
-            'SELECT id, score, correct_answers, total_questions, started_at, finished_at FROM quiz_attempts WHERE quiz_id = %s AND user_id = %s ORDER BY finished_at DESC',
-            (quiz_id, payload['user_id'])
-        )
-        attempts = cursor.fetchall()
-        cursor.close()
-        
-        result = [
-            {
-                'id': a[0],
-                'score': float(a[1]) if a[1] else None,
-                'correct_answers': a[2],
-                'total_questions': a[3],
-                'started_at': str(a[4]),
-                'finished_at': str(a[5])
-            } for a in attempts
-        ]
+        return jsonify(item_analysis.report(quiz, db)), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Fold new attempts into the item analysis (also runs as `python item_analysis.py`)
+@app.route('/quizzes/analysis/run', methods=['POST'])
+@token_required
+def run_quiz_analysis(payload):
+    try:
+        if payload['role'] not in ['admin', 'instructor']:
+            return jsonify({'error': 'Unauthorized'}), 403
         
-        return jsonify(result), 200
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
+        data = request.get_json(silent=True) or {}
+        updated = item_analysis.update_all(quiz_cache, get_db(), data.get('quiz_ids'))
+        
+        return jsonify({'updated': {str(quiz_id): attempts for quiz_id, attempts in updated.items()}}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,377 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timedelta
+import mysql.connector
+import dal
+import database
+
+logger = logging.getLogger('ingest')
+
+ATTEMPT_COLUMNS = ('submission_id', 'quiz_id', 'user_id', 'score', 'total_questions', 'correct_answers',
+                   'started_at', 'finished_at')
+ANSWER_COLUMNS = ('attempt_id', 'question_id', 'choice_id', 'is_correct')
+SUMMARY_COLUMNS = ('user_id', 'quiz_id', 'attempts', 'best_score', 'last_score', 'last_attempt_at')
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Seconds the DB session's clock (what NOW() returns) is ahead of UTC
+SESSION_UTC_OFFSET = dal.Query('ingest_session_utc_offset', 'SELECT TIMESTAMPDIFF(SECOND, UTC_TIMESTAMP(), NOW())')
+
+
+class QueueFull(Exception):
+    """The write-behind queue stayed full for INGEST_ENQUEUE_TIMEOUT"""
+
+    def __init__(self, retry_after):
+        super().__init__('Too many submissions waiting to be written; retry shortly')
+        self.retry_after = retry_after
+
+
+class Journal:
+    """Append-only file of accepted submissions, one JSON line each.
+
+    A checkpoint file next to it holds the sequence number of the last
+    submission committed to MySQL; records after it are replayed on start.
+    Each process claims the first journal-<n>.log in `directory` it can
+    lock, so a restarted worker takes over the journal of one that died.
+    Appends are fsynced in groups: a writer whose line was already covered
+    by another thread's fsync returns without one.
+    """
+
+    def __init__(self, directory, fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        self.path = None
+        self.size = 0
+        self._fd = None
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+
+    def open(self):
+        """Lock a journal file and return (checkpoint, records not yet flushed)"""
+        os.makedirs(self.directory, exist_ok=True)
+        n = 0
+        while True:
+            path = os.path.join(self.directory, f'journal-{n}.log')
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                os.close(fd)
+                n += 1
+        self._fd = fd
+        self.path = path
+        checkpoint = self._read_checkpoint()
+
+        records = []
+        with open(path, 'rb') as f:
+            data = f.read()
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line torn by a crash mid-write was never acknowledged
+                continue
+            if record['seq'] > checkpoint:
+                records.append(record)
+        # Drop any torn tail so new lines start clean
+        valid = data.rfind(b'\n') + 1
+        if valid < len(data):
+            os.ftruncate(fd, valid)
+        self.size = valid
+        return checkpoint, records
+
+    def append(self, record):
+        """Write one record; the caller serializes appends. Returns its write position."""
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+        os.write(self._fd, line)
+        self.size += len(line)
+        self._written += 1
+        return self._written
+
+    def sync(self, position):
+        """Make the write at `position` durable"""
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= position:
+                return
+            # Everything written so far is covered by this fsync
+            target = self._written
+            os.fsync(self._fd)
+            self._synced = target
+
+    def checkpoint(self, seq):
+        tmp = self.path + '.ckpt.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path + '.ckpt')
+
+    def truncate(self):
+        """Empty the journal; only when every record in it is checkpointed"""
+        os.ftruncate(self._fd, 0)
+        self.size = 0
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.path + '.ckpt') as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+
+class IngestQueue:
+    """Write-behind queue for graded quiz attempts.
+
+    `submit` journals an attempt and returns once it is durable on local
+    disk. A background thread writes queued attempts to MySQL in
+    transactions of up to `batch_size`, waiting up to `flush_interval`
+    seconds for a batch to fill. With `max_pending` attempts waiting,
+    `submit` blocks for up to `enqueue_timeout` seconds and then raises
+    QueueFull. Rows carry a unique submission_id, so replaying a journal
+    whose batch was committed but not checkpointed inserts nothing twice.
+    """
+
+    def __init__(self, journal, max_pending=10000, batch_size=500, flush_interval=0.05, enqueue_timeout=1.0,
+                 compact_bytes=64 * 1024 * 1024):
+        self.journal = journal
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.compact_bytes = compact_bytes
+        self.enabled = False
+        self._cond = threading.Condition()
+        self._pending = deque()
+        # Queued attempts per (user_id, quiz_id), for max_attempts checks
+        self._pending_by_user = Counter()
+        self._seq = 0
+        self._stopping = False
+        self._thread = None
+        self._enqueued = 0
+        self._flushed = 0
+        self._batches = 0
+        self._rejected = 0
+        self._replayed = 0
+        self._dropped = 0
+        self._failures = 0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            Journal(config.INGEST_JOURNAL_DIR, config.INGEST_JOURNAL_FSYNC),
+            max_pending=config.INGEST_MAX_PENDING,
+            batch_size=config.INGEST_BATCH_SIZE,
+            flush_interval=config.INGEST_FLUSH_INTERVAL,
+            enqueue_timeout=config.INGEST_ENQUEUE_TIMEOUT
+        )
+
+    def start(self):
+        """Claim a journal, queue what it still holds and start the writer thread"""
+        checkpoint, records = self.journal.open()
+        now = time.monotonic()
+        with self._cond:
+            self._seq = max([checkpoint] + [record['seq'] for record in records])
+            self._pending.extend((now, record) for record in records)
+            self._pending_by_user.update((record['user_id'], record['quiz_id']) for record in records)
+            self._replayed = len(records)
+        if records:
+            logger.warning('Replaying %d queued quiz attempts from %s', len(records), self.journal.path)
+        self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+        self._thread.start()
+        self.enabled = True
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Flush what is queued and stop the writer"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, quiz_id, user_id, score, total_questions, correct_answers, answers):
+        """Queue a graded attempt; returns its submission id once journaled"""
+        # Kept in UTC; the writer shifts it to the DB session's time zone
+        now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+        record = {
+            'submission_id': uuid.uuid4().hex,
+            'quiz_id': quiz_id,
+            'user_id': user_id,
+            'score': score,
+            'total_questions': total_questions,
+            'correct_answers': correct_answers,
+            'finished_at_utc': now,
+            'answers': answers
+        }
+        deadline = time.monotonic() + self.enqueue_timeout
+        with self._cond:
+            while len(self._pending) >= self.max_pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._rejected += 1
+                    raise QueueFull(self.flush_interval + self.enqueue_timeout)
+                self._cond.wait(remaining)
+            self._seq += 1
+            record['seq'] = self._seq
+            position = self.journal.append(record)
+            self._pending.append((time.monotonic(), record))
+            self._pending_by_user[(user_id, quiz_id)] += 1
+            self._enqueued += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        self.journal.sync(position)
+        return record['submission_id']
+
+    def pending_attempts(self, user_id, quiz_id):
+        """Attempts by this user at this quiz still waiting in this process's queue"""
+        with self._cond:
+            return self._pending_by_user.get((user_id, quiz_id), 0)
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._cond:
+                if not self._pending:
+                    if self._stopping:
+                        return
+                    self._cond.wait()
+                    continue
+                # Give a batch the flush interval to fill, counted from its oldest record
+                wait = self._pending[0][0] + self.flush_interval - time.monotonic()
+                if len(self._pending) < self.batch_size and wait > 0 and not self._stopping:
+                    self._cond.wait(wait)
+                    continue
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                self._flush(batch)
+            except Exception:
+                logger.exception('Writing %d queued quiz attempts failed; retrying', len(batch))
+                with self._cond:
+                    self._failures += 1
+                    self._pending.extendleft(reversed(batch))
+                    if self._stopping:
+                        return
+                # Back off on consecutive failures only; a success starts over
+                failures += 1
+                time.sleep(min(5.0, self.flush_interval * 2 ** min(failures, 10)))
+            else:
+                failures = 0
+
+    def _flush(self, batch):
+        try:
+            self._write([record for _, record in batch])
+        except mysql.connector.IntegrityError:
+            if len(batch) > 1:
+                # Find the offending attempt by writing the rest one by one
+                for item in batch:
+                    self._flush([item])
+                return
+            # e.g. the quiz was deleted after grading; retrying cannot help
+            logger.error('Dropping queued quiz attempt %s', batch[0][1]['submission_id'], exc_info=True)
+            with self._cond:
+                self._dropped += 1
+        lag = time.monotonic() - batch[0][0]
+        # Only this thread checkpoints, so submitters need not wait on the fsync
+        self.journal.checkpoint(batch[-1][1]['seq'])
+        with self._cond:
+            for _, record in batch:
+                key = (record['user_id'], record['quiz_id'])
+                self._pending_by_user[key] -= 1
+                if self._pending_by_user[key] <= 0:
+                    del self._pending_by_user[key]
+            self._flushed += len(batch)
+            self._batches += 1
+            self._last_lag = lag
+            self._max_lag = max(self._max_lag, lag)
+            if not self._pending and self.journal.size > self.compact_bytes:
+                self.journal.truncate()
+            self._cond.notify_all()
+
+    def _write(self, records):
+        """Insert a batch of attempts, their answers and summary updates in one transaction"""
+        with database.connection() as db:
+            # Attempts committed before a crash and now replayed are skipped
+            # whole, so their summary counts are not added twice
+            written = _attempt_ids([r['submission_id'] for r in records], db)
+            records = [r for r in records if r['submission_id'] not in written]
+            if not records:
+                return
+            # Stamp attempts on the same clock as NOW() on the synchronous path
+            offset = timedelta(seconds=dal.fetch_rows(SESSION_UTC_OFFSET, (), db)[0][0])
+            finished = {r['submission_id']: _session_time(r['finished_at_utc'], offset) for r in records}
+            dal.upsert_many('ingest_attempts', 'quiz_attempts', ATTEMPT_COLUMNS, [
+                (r['submission_id'], r['quiz_id'], r['user_id'], r['score'], r['total_questions'],
+                 r['correct_answers'], finished[r['submission_id']], finished[r['submission_id']])
+                for r in records
+            ], [('id', 'id')], db)
+            attempt_ids = _attempt_ids([r['submission_id'] for r in records], db)
+            dal.upsert_many('ingest_attempt_answers', 'attempt_answers', ANSWER_COLUMNS, [
+                (attempt_ids[r['submission_id']], question_id, choice_id, is_correct)
+                for r in records
+                for question_id, choice_id, is_correct in r['answers']
+            ], [('attempt_id', 'attempt_id')], db)
+            dal.upsert_many('ingest_user_summary', 'quiz_user_summary', SUMMARY_COLUMNS, _summaries(records, finished), [
+                ('attempts', 'attempts + VALUES(attempts)'),
+                ('best_score', 'GREATEST(COALESCE(best_score, 0), VALUES(best_score))'),
+                'last_score',
+                'last_attempt_at'
+            ], db)
+            db.commit()
+
+    def stats(self):
+        with self._cond:
+            oldest = time.monotonic() - self._pending[0][0] if self._pending else 0
+            return {
+                'enabled': self.enabled,
+                'pending': len(self._pending),
+                'max_pending': self.max_pending,
+                'enqueued': self._enqueued,
+                'flushed': self._flushed,
+                'batches': self._batches,
+                'avg_batch': round(self._flushed / self._batches, 2) if self._batches else 0,
+                'rejected': self._rejected,
+                'replayed': self._replayed,
+                'dropped': self._dropped,
+                'write_failures': self._failures,
+                'oldest_pending_ms': round(oldest * 1000, 3),
+                'flush_lag_ms': round(self._last_lag * 1000, 3),
+                'max_flush_lag_ms': round(self._max_lag * 1000, 3),
+                'journal_bytes': self.journal.size
+            }
+
+
+def _attempt_ids(submission_ids, db):
+    """{submission_id: attempt id} for those already in quiz_attempts"""
+    return dict(dal.fetch_rows(dal.Query(
+        'ingest_attempt_ids',
+        'SELECT submission_id, id FROM quiz_attempts WHERE submission_id IN ('
+        + ', '.join(['%s'] * len(submission_ids)) + ')',
+        prepared=False
+    ), submission_ids, db))
+
+
+def _session_time(utc, offset):
+    return (datetime.strptime(utc, TIMESTAMP_FORMAT) + offset).strftime(TIMESTAMP_FORMAT)
+
+
+def _summaries(records, finished):
+    """quiz_user_summary increments for a batch, one row per (user, quiz)"""
+    rows = {}
+    for r in records:
+        key = (r['user_id'], r['quiz_id'])
+        attempts, best, _, _ = rows.get(key, (0, 0, None, None))
+        # Records are in submission order, so the last one seen is the latest
+        rows[key] = (attempts + 1, max(best, r['score']), r['score'], finished[r['submission_id']])
+    return [key + row for key, row in rows.items()]
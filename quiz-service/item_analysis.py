@@ -0,0 +1,224 @@
+"""Classical item analysis for quizzes.
+
+Per question: difficulty (p-value, share answered correctly), discrimination
+(point-biserial between answering correctly and the rest of the attempt's
+score) and how often each choice was picked. Per quiz: KR-20 reliability.
+
+Every statistic is derived from running sums kept in quiz_item_stats,
+quiz_choice_stats and quiz_analysis_state, so `update` only reads attempts
+newer than the last run. It streams their answer rows in chunks into NumPy
+arrays and adds them to the sums with bincount.
+
+Run as a batch job (e.g. from cron):
+
+    python item_analysis.py            # every quiz with new attempts
+    python item_analysis.py 12 15      # just these quizzes
+"""
+import sys
+import time
+import numpy as np
+import dal
+import database
+import queries
+from config import Config
+from quiz_cache import load_quiz
+
+
+class Sums:
+    """Running sums for one quiz's questions (aligned to `question_ids`) and choices"""
+
+    def __init__(self, question_ids, choice_ids):
+        self.question_ids = question_ids
+        self.choice_ids = choice_ids
+        k = len(question_ids)
+        self.answers = np.zeros(k)
+        self.correct = np.zeros(k)
+        self.sum_total = np.zeros(k)
+        self.sum_total_sq = np.zeros(k)
+        self.sum_correct_total = np.zeros(k)
+        self.selections = np.zeros(len(choice_ids))
+
+    def add(self, chunk):
+        """Add a chunk of (question_id, choice_id, is_correct, attempt total) rows"""
+        rows = np.asarray(chunk, dtype=np.float64)
+        question, choice, correct, total = rows[:, 0], rows[:, 1], rows[:, 2], rows[:, 3]
+        # Answers to questions no longer in the quiz are ignored
+        qi, known = _positions(self.question_ids, question)
+        qi, correct, total = qi[known], correct[known], total[known]
+        k = len(self.question_ids)
+        self.answers += np.bincount(qi, minlength=k)
+        self.correct += np.bincount(qi, correct, minlength=k)
+        self.sum_total += np.bincount(qi, total, minlength=k)
+        self.sum_total_sq += np.bincount(qi, total * total, minlength=k)
+        self.sum_correct_total += np.bincount(qi, correct * total, minlength=k)
+        ci, known = _positions(self.choice_ids, choice[known])
+        self.selections += np.bincount(ci[known], minlength=len(self.choice_ids))
+
+
+def _positions(ids, values):
+    """Index of each value in the sorted `ids`, and a mask of values found there"""
+    if not len(ids):
+        return np.zeros(len(values), dtype=np.intp), np.zeros(len(values), dtype=bool)
+    index = np.searchsorted(ids, values)
+    index[index == len(ids)] = 0
+    return index, ids[index] == values
+
+
+def _ids(quiz):
+    question_ids = np.array(sorted(quiz.answer_key), dtype=np.float64)
+    choice_ids = np.array(sorted(c for choices in quiz.answer_key.values() for c in choices), dtype=np.float64)
+    return question_ids, choice_ids
+
+
+def update(quiz, db, chunk_rows=50000, settle_seconds=10):
+    """Add attempts newer than the last run to the quiz's sums, in one transaction.
+
+    The quiz's state row is locked for the whole transaction, so a run that
+    overlaps this one waits and then starts from where this one stopped.
+    Attempts younger than `settle_seconds` wait for the next run: ids are
+    handed out before commit, so a lower id may still become visible after
+    a higher one. Returns the number of attempts added.
+    """
+    dal.execute(queries.ENSURE_ANALYSIS_STATE, (quiz.quiz_id,), db)
+    last_attempt_id = dal.fetch_rows(queries.LOCK_ANALYSIS_STATE, (quiz.quiz_id,), db)[0][0]
+    upper = dal.fetch_rows(queries.ANALYSIS_UPPER_BOUND, (quiz.quiz_id, last_attempt_id, settle_seconds), db)[0][0]
+    if upper is None:
+        db.commit()
+        return 0
+    attempts, sum_total, sum_total_sq = dal.fetch_rows(
+        queries.ANALYSIS_ATTEMPT_TOTALS, (quiz.quiz_id, last_attempt_id, upper), db
+    )[0]
+
+    sums = Sums(*_ids(quiz))
+    cursor = db.cursor()
+    rows = 0
+    started = time.perf_counter()
+    try:
+        cursor.execute(queries.ANALYSIS_ANSWERS.sql, (quiz.quiz_id, last_attempt_id, upper))
+        while True:
+            chunk = cursor.fetchmany(chunk_rows)
+            if not chunk:
+                break
+            sums.add(chunk)
+            rows += len(chunk)
+    finally:
+        cursor.close()
+        dal.query_stats.record(queries.ANALYSIS_ANSWERS.name, time.perf_counter() - started, rows)
+
+    touched = np.flatnonzero(sums.answers)
+    dal.upsert_many('analysis_items_add', 'quiz_item_stats', (
+        'quiz_id', 'question_id', 'answers', 'correct', 'sum_total', 'sum_total_sq', 'sum_correct_total'
+    ), [
+        (quiz.quiz_id, int(sums.question_ids[i]), int(sums.answers[i]), int(sums.correct[i]),
+         float(sums.sum_total[i]), float(sums.sum_total_sq[i]), float(sums.sum_correct_total[i]))
+        for i in touched
+    ], [(c, f'{c} + VALUES({c})') for c in ('answers', 'correct', 'sum_total', 'sum_total_sq', 'sum_correct_total')], db)
+    picked = np.flatnonzero(sums.selections)
+    dal.upsert_many('analysis_choices_add', 'quiz_choice_stats', ('quiz_id', 'choice_id', 'selections'), [
+        (quiz.quiz_id, int(sums.choice_ids[i]), int(sums.selections[i])) for i in picked
+    ], [('selections', 'selections + VALUES(selections)')], db)
+    dal.upsert_many('analysis_state_add', 'quiz_analysis_state', (
+        'quiz_id', 'last_attempt_id', 'attempts', 'sum_total', 'sum_total_sq'
+    ), [(quiz.quiz_id, upper, attempts, float(sum_total), float(sum_total_sq))], [
+        'last_attempt_id',
+        ('attempts', 'attempts + VALUES(attempts)'),
+        ('sum_total', 'sum_total + VALUES(sum_total)'),
+        ('sum_total_sq', 'sum_total_sq + VALUES(sum_total_sq)')
+    ], db)
+    db.commit()
+    return attempts
+
+
+def report(quiz, db=None):
+    """Item statistics for a compiled quiz from its stored sums"""
+    state = dal.fetch_rows(queries.ANALYSIS_STATE, (quiz.quiz_id,), db)
+    question_ids, choice_ids = _ids(quiz)
+    sums = Sums(question_ids, choice_ids)
+
+    items = dal.fetch_rows(queries.ANALYSIS_ITEMS, (quiz.quiz_id,), db)
+    if items:
+        stored = np.asarray(items, dtype=np.float64)
+        qi, known = _positions(question_ids, stored[:, 0])
+        for column, values in zip(
+            (sums.answers, sums.correct, sums.sum_total, sums.sum_total_sq, sums.sum_correct_total), stored[:, 1:].T
+        ):
+            column[qi[known]] = values[known]
+    choices = dal.fetch_rows(queries.ANALYSIS_CHOICES, (quiz.quiz_id,), db)
+    if choices:
+        stored = np.asarray(choices, dtype=np.float64)
+        ci, known = _positions(choice_ids, stored[:, 0])
+        sums.selections[ci[known]] = stored[known, 1]
+
+    n, x = sums.answers, sums.correct
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = x / n
+        # Rest score (attempt total minus this item), so an item is not correlated with itself
+        rest = sums.sum_total - x
+        rest_sq = sums.sum_total_sq - 2 * sums.sum_correct_total + x
+        correct_rest = sums.sum_correct_total - x
+        discrimination = (n * correct_rest - x * rest) / np.sqrt((n * x - x * x) * (n * rest_sq - rest * rest))
+
+    attempts = state[0][1] if state else 0
+    k = len(question_ids)
+    kr20 = None
+    if state and attempts and k > 1:
+        mean = state[0][2] / attempts
+        variance = state[0][3] / attempts - mean * mean
+        answered = n > 0
+        if variance > 0 and answered.all():
+            kr20 = k / (k - 1) * (1 - float(np.sum(p * (1 - p))) / variance)
+
+    position = {int(q): i for i, q in enumerate(question_ids)}
+    choice_position = {int(c): i for i, c in enumerate(choice_ids)}
+    return {
+        'quiz_id': quiz.quiz_id,
+        'attempts': attempts,
+        'analyzed_through_attempt': state[0][0] if state else 0,
+        'updated_at': str(state[0][4]) if state else None,
+        'kr20': _number(kr20),
+        'questions': [
+            {
+                'question_id': question['id'],
+                'answers': int(n[position[question['id']]]),
+                'p_value': _number(p[position[question['id']]]),
+                'point_biserial': _number(discrimination[position[question['id']]]),
+                'choices': [
+                    {
+                        'choice_id': choice['id'],
+                        'is_correct': quiz.answer_key[question['id']][choice['id']],
+                        'selections': int(sums.selections[choice_position[choice['id']]]),
+                        'rate': _number(
+                            sums.selections[choice_position[choice['id']]] / n[position[question['id']]]
+                            if n[position[question['id']]] else None
+                        )
+                    }
+                    for choice in question['choices']
+                ]
+            }
+            for question in quiz.payload['questions']
+        ]
+    }
+
+
+def _number(value):
+    return None if value is None or not np.isfinite(value) else round(float(value), 4)
+
+
+def update_all(cache, db, quiz_ids=None):
+    """Bring the sums of the given quizzes (default: all with new attempts) up to date"""
+    if quiz_ids is None:
+        quiz_ids = [row[0] for row in dal.fetch_rows(queries.QUIZZES_WITH_NEW_ATTEMPTS, (), db)]
+    updated = {}
+    for quiz_id in quiz_ids:
+        quiz = load_quiz(cache, queries.QUIZ_BY_ID, quiz_id, db)
+        if quiz:
+            updated[quiz_id] = update(quiz, db, Config.ITEM_ANALYSIS_CHUNK_ROWS, Config.ITEM_ANALYSIS_SETTLE_SECONDS)
+    return updated
+
+
+if __name__ == '__main__':
+    from quiz_cache import QuizCache
+    with database.connection() as db:
+        result = update_all(QuizCache(), db, [int(arg) for arg in sys.argv[1:]] or None)
+    for quiz_id, attempts in result.items():
+        print(f'quiz {quiz_id}: {attempts} new attempts')
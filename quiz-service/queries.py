@@ -0,0 +1,165 @@
+from dal import Query, to_str, str_or_none, float_or_none
+
+USER_ATTEMPTS = Query(
+    'user_attempts',
+    'SELECT id, score, correct_answers, total_questions, started_at, finished_at FROM quiz_attempts WHERE quiz_id = %s AND user_id = %s ORDER BY finished_at DESC',
+    ('id', ('score', float_or_none), 'correct_answers', 'total_questions', ('started_at', to_str), ('finished_at', to_str))
+)
+
+# Quiz row followed by its version: updated_at, then the count and newest
+# updated_at of its questions and of its choices
+_QUIZ_WITH_VERSION = '''SELECT q.id, q.lesson_id, q.title, q.passing_score, q.max_attempts, q.updated_at,
+       (SELECT COUNT(*) FROM questions qs WHERE qs.quiz_id = q.id),
+       (SELECT MAX(qs.updated_at) FROM questions qs WHERE qs.quiz_id = q.id),
+       (SELECT COUNT(*) FROM choices c JOIN questions qs ON c.question_id = qs.id WHERE qs.quiz_id = q.id),
+       (SELECT MAX(c.updated_at) FROM choices c JOIN questions qs ON c.question_id = qs.id WHERE qs.quiz_id = q.id)
+FROM quizzes q'''
+
+QUIZ_BY_LESSON = Query('quiz_by_lesson', _QUIZ_WITH_VERSION + ' WHERE q.lesson_id = %s LIMIT 1')
+
+QUIZ_BY_ID = Query('quiz_by_id', _QUIZ_WITH_VERSION + ' WHERE q.id = %s')
+
+QUIZZES_BY_MODULE = Query(
+    'quizzes_by_module',
+    _QUIZ_WITH_VERSION + ' JOIN lessons l ON l.id = q.lesson_id WHERE l.module_id = %s ORDER BY l.order_index, q.id'
+)
+
+QUIZZES_BY_COURSE = Query(
+    'quizzes_by_course',
+    _QUIZ_WITH_VERSION + ''' JOIN lessons l ON l.id = q.lesson_id JOIN modules m ON m.id = l.module_id
+       WHERE m.course_id = %s ORDER BY m.order_index, l.order_index, q.id'''
+)
+
+
+def _placeholders(count):
+    return '(' + ', '.join(['%s'] * count) + ')'
+
+
+def quizzes_by_lessons(count):
+    """Quizzes (with version) of `count` lesson ids; not prepared, as the IN list varies"""
+    return Query(
+        'quizzes_by_lessons',
+        _QUIZ_WITH_VERSION + f' WHERE q.lesson_id IN {_placeholders(count)} ORDER BY q.lesson_id, q.id',
+        prepared=False
+    )
+
+# Every question and choice of a quiz in one round trip, in display order
+QUIZ_CONTENT = Query(
+    'quiz_content',
+    '''SELECT qs.id, qs.prompt, qs.type, qs.order_index, c.id, c.text, c.order_index, c.is_correct
+       FROM questions qs LEFT JOIN choices c ON c.question_id = qs.id
+       WHERE qs.quiz_id = %s
+       ORDER BY qs.order_index, qs.id, c.order_index, c.id'''
+)
+
+
+def quizzes_content(count):
+    """QUIZ_CONTENT for `count` quiz ids at once, each row led by its quiz id"""
+    return Query(
+        'quizzes_content',
+        f'''SELECT qs.quiz_id, qs.id, qs.prompt, qs.type, qs.order_index, c.id, c.text, c.order_index, c.is_correct
+            FROM questions qs LEFT JOIN choices c ON c.question_id = qs.id
+            WHERE qs.quiz_id IN {_placeholders(count)}
+            ORDER BY qs.quiz_id, qs.order_index, qs.id, c.order_index, c.id''',
+        prepared=False
+    )
+
+INSERT_ATTEMPT = Query(
+    'insert_attempt',
+    '''INSERT INTO quiz_attempts (quiz_id, user_id, score, total_questions, correct_answers, started_at, finished_at)
+       VALUES (%s, %s, %s, %s, %s, NOW(), NOW())'''
+)
+
+INSERT_ATTEMPT_ANSWERS = Query(
+    'insert_attempt_answers',
+    'INSERT INTO attempt_answers (attempt_id, question_id, choice_id, is_correct) VALUES (%s, %s, %s, %s)'
+)
+
+# Item analysis (see item_analysis.py)
+ANALYSIS_STATE = Query(
+    'analysis_state',
+    'SELECT last_attempt_id, attempts, sum_total, sum_total_sq, updated_at FROM quiz_analysis_state WHERE quiz_id = %s'
+)
+
+# An update locks the quiz's state row first, so overlapping runs (cron and
+# the endpoint, or two workers) add each attempt range once
+ENSURE_ANALYSIS_STATE = Query(
+    'ensure_analysis_state',
+    'INSERT IGNORE INTO quiz_analysis_state (quiz_id, last_attempt_id, attempts, sum_total, sum_total_sq) '
+    'VALUES (%s, 0, 0, 0, 0)'
+)
+
+LOCK_ANALYSIS_STATE = Query(
+    'lock_analysis_state',
+    'SELECT last_attempt_id FROM quiz_analysis_state WHERE quiz_id = %s FOR UPDATE'
+)
+
+# Newest attempt old enough that no transaction with a lower id can still be open
+ANALYSIS_UPPER_BOUND = Query(
+    'analysis_upper_bound',
+    '''SELECT MAX(id) FROM quiz_attempts
+       WHERE quiz_id = %s AND id > %s AND created_at < NOW() - INTERVAL %s SECOND'''
+)
+
+ANALYSIS_ATTEMPT_TOTALS = Query(
+    'analysis_attempt_totals',
+    '''SELECT COUNT(*), COALESCE(SUM(correct_answers), 0), COALESCE(SUM(correct_answers * correct_answers), 0)
+       FROM quiz_attempts WHERE quiz_id = %s AND id > %s AND id <= %s'''
+)
+
+# Streamed with fetchmany rather than through dal, so it is never fully buffered
+ANALYSIS_ANSWERS = Query(
+    'analysis_answers',
+    '''SELECT a.question_id, COALESCE(a.choice_id, 0), COALESCE(a.is_correct, 0), COALESCE(qa.correct_answers, 0)
+       FROM quiz_attempts qa JOIN attempt_answers a ON a.attempt_id = qa.id
+       WHERE qa.quiz_id = %s AND qa.id > %s AND qa.id <= %s'''
+)
+
+ANALYSIS_ITEMS = Query(
+    'analysis_items',
+    '''SELECT question_id, answers, correct, sum_total, sum_total_sq, sum_correct_total
+       FROM quiz_item_stats WHERE quiz_id = %s'''
+)
+
+ANALYSIS_CHOICES = Query(
+    'analysis_choices',
+    'SELECT choice_id, selections FROM quiz_choice_stats WHERE quiz_id = %s'
+)
+
+QUIZZES_WITH_NEW_ATTEMPTS = Query(
+    'quizzes_with_new_attempts',
+    '''SELECT q.id FROM quizzes q LEFT JOIN quiz_analysis_state s ON s.quiz_id = q.id
+       WHERE EXISTS (SELECT 1 FROM quiz_attempts qa WHERE qa.quiz_id = q.id AND qa.id > COALESCE(s.last_attempt_id, 0))
+       ORDER BY q.id'''
+)
+
+# Per-(user, quiz) attempt summary, kept in step with quiz_attempts
+RECORD_USER_SUMMARY = Query(
+    'record_user_summary',
+    '''INSERT INTO quiz_user_summary (user_id, quiz_id, attempts, best_score, last_score, last_attempt_at)
+       VALUES (%s, %s, 1, %s, %s, NOW())
+       ON DUPLICATE KEY UPDATE
+       attempts = attempts + 1,
+       best_score = GREATEST(COALESCE(best_score, 0), VALUES(best_score)),
+       last_score = VALUES(last_score),
+       last_attempt_at = VALUES(last_attempt_at)'''
+)
+
+USER_SUMMARY_ATTEMPTS = Query(
+    'user_summary_attempts',
+    'SELECT attempts FROM quiz_user_summary WHERE user_id = %s AND quiz_id = %s'
+)
+
+COURSE_QUIZ_STATUS = Query(
+    'course_quiz_status',
+    '''SELECT q.id, q.lesson_id, q.title, q.passing_score, q.max_attempts,
+              COALESCE(s.attempts, 0), s.best_score, s.last_score, s.last_attempt_at
+       FROM modules m
+       JOIN lessons l ON l.module_id = m.id
+       JOIN quizzes q ON q.lesson_id = l.id
+       LEFT JOIN quiz_user_summary s ON s.quiz_id = q.id AND s.user_id = %s
+       WHERE m.course_id = %s
+       ORDER BY m.order_index, l.order_index, q.id''',
+    ('quiz_id', 'lesson_id', 'title', 'passing_score', 'max_attempts', 'attempts', ('best_score', float_or_none),
+     ('last_score', float_or_none), ('last_attempt_at', str_or_none))
+)
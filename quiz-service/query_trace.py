@@ -0,0 +1,192 @@
+import logging
+import re
+import threading
+import time
+from flask import g, request, has_request_context
+from config import Config
+
+logger = logging.getLogger('query_trace')
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+
+
+def statement_shape(sql):
+    """SQL with literals and placeholder lists collapsed, so repeats of one statement compare equal"""
+    shape = _WHITESPACE.sub(' ', sql).strip()
+    shape = _LITERALS.sub('?', shape)
+    return _LISTS.sub('(...)', shape)
+
+
+class RequestTrace:
+    __slots__ = ('count', 'seconds', 'shapes', 'flagged')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}
+        self.flagged = []
+
+
+class QueryTracer:
+    """Per-request statement counts and DB time.
+
+    Statements slower than `slow_ms` are logged with their parameters. When
+    one statement shape runs more than `repeat_threshold` times in a request
+    it is logged as a likely N+1. With `timing_header` set, responses carry
+    the totals in a Server-Timing header.
+    """
+
+    def __init__(self, slow_ms=100, repeat_threshold=10, timing_header=False, enabled=True):
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.timing_header = timing_header
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._slow = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config.SLOW_QUERY_MS,
+            config.N_PLUS_ONE_THRESHOLD,
+            config.QUERY_TRACE_HEADERS,
+            config.QUERY_TRACE_ENABLED
+        )
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+
+    def record(self, sql, params, seconds):
+        if not self.enabled:
+            return
+        if seconds * 1000 >= self.slow_ms:
+            with self._lock:
+                self._slow += 1
+            logger.warning('Slow query (%.1f ms): %s params=%r', seconds * 1000, _WHITESPACE.sub(' ', sql).strip(), params)
+        trace = g.get('query_trace') if has_request_context() else None
+        if trace is None:
+            return
+        trace.count += 1
+        trace.seconds += seconds
+        shape = statement_shape(sql)
+        runs = trace.shapes[shape] = trace.shapes.get(shape, 0) + 1
+        if runs == self.repeat_threshold + 1:
+            trace.flagged.append(shape)
+
+    def add_time(self, seconds):
+        """Fetch time for rows of a statement already counted"""
+        trace = g.get('query_trace') if self.enabled and has_request_context() else None
+        if trace is not None:
+            trace.seconds += seconds
+
+    def _start(self):
+        if self.enabled:
+            g.query_trace = RequestTrace()
+
+    def _finish(self, response):
+        trace = g.pop('query_trace', None)
+        if trace is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        for shape in trace.flagged:
+            logger.warning('Possible N+1 in %s %s: ran %d times: %s', request.method, route, trace.shapes[shape], shape)
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'requests': 0, 'queries': 0, 'max_queries': 0, 'db_seconds': 0.0, 'n_plus_one': 0
+                }
+            stats['requests'] += 1
+            stats['queries'] += trace.count
+            stats['max_queries'] = max(stats['max_queries'], trace.count)
+            stats['db_seconds'] += trace.seconds
+            stats['n_plus_one'] += len(trace.flagged)
+        if self.timing_header:
+            response.headers.add('Server-Timing', f'db;dur={trace.seconds * 1000:.1f};desc="{trace.count} queries"')
+        return response
+
+    def route_stats(self):
+        with self._lock:
+            return {
+                route: dict(
+                    stats,
+                    db_seconds=round(stats['db_seconds'], 6),
+                    avg_queries=round(stats['queries'] / stats['requests'], 2)
+                )
+                for route, stats in self._routes.items()
+            }
+
+    def stats(self):
+        with self._lock:
+            slow = self._slow
+        return {
+            'enabled': self.enabled,
+            'slow_query_ms': self.slow_ms,
+            'n_plus_one_threshold': self.repeat_threshold,
+            'slow_queries': slow,
+            'routes': self.route_stats()
+        }
+
+
+tracer = QueryTracer.from_config(Config)
+
+
+class TracedCursor:
+    """Cursor that reports each statement's time to the tracer"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            tracer.record(operation, params, time.perf_counter() - started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            rows = len(seq_params) if hasattr(seq_params, '__len__') else '?'
+            tracer.record(operation, f'<{rows} rows>', time.perf_counter() - started)
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed(self._cursor.fetchmany, *args, **kwargs)
+
+    def _timed(self, fetch, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fetch(*args, **kwargs)
+        finally:
+            tracer.add_time(time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    """Connection wrapper whose cursors are traced; everything else passes through"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return TracedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
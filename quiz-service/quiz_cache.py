@@ -0,0 +1,204 @@
+import threading
+from collections import OrderedDict
+import dal
+import queries
+
+
+class InvalidAnswers(ValueError):
+    """Submitted answers the quiz cannot accept: malformed, unknown or repeated ids"""
+
+
+def answer_id(value):
+    """An id sent as a JSON integer or a numeric string, as an int"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise InvalidAnswers('question_id and choice_id must be integers')
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidAnswers('question_id and choice_id must be integers')
+
+
+def version_updated_at(version):
+    """Timestamps in a quiz version: quiz, questions and choices updated_at"""
+    return version[0], version[2], version[4]
+
+
+class CompiledQuiz:
+    """A quiz assembled once from its rows.
+
+    `payload` is what clients see (no is_correct); `answer_key` maps
+    question id -> {choice id: is_correct} for grading. `version` is the
+    quiz's row counts and max updated_at values at load time.
+    """
+
+    __slots__ = ('quiz_id', 'lesson_id', 'version', 'payload', 'answer_key')
+
+    def __init__(self, quiz_id, lesson_id, version, payload, answer_key):
+        self.quiz_id = quiz_id
+        self.lesson_id = lesson_id
+        self.version = version
+        self.payload = payload
+        self.answer_key = answer_key
+
+    @property
+    def updated_at(self):
+        return version_updated_at(self.version)
+
+    def grade(self, answers):
+        """(question_id, choice_id, is_correct) per submitted answer, and the correct count.
+
+        Ids may be sent as strings. Raises InvalidAnswers for an id that is
+        not an integer, a question not in this quiz, a choice that does not
+        belong to its question or a question answered twice, so everything
+        graded here is also accepted by the attempt_answers foreign keys.
+        """
+        if not isinstance(answers, list) or not all(isinstance(answer, dict) for answer in answers):
+            raise InvalidAnswers('answers must be a list of {question_id, choice_id} objects')
+        graded = []
+        correct = 0
+        seen = set()
+        for answer in answers:
+            question_id = answer_id(answer.get('question_id'))
+            choice_id = answer_id(answer.get('choice_id'))
+            choices = self.answer_key.get(question_id)
+            if choices is None:
+                raise InvalidAnswers(f'Question {question_id} is not in this quiz')
+            if choice_id not in choices:
+                raise InvalidAnswers(f'Choice {choice_id} does not belong to question {question_id}')
+            if question_id in seen:
+                raise InvalidAnswers(f'Question {question_id} is answered more than once')
+            seen.add(question_id)
+            is_correct = choices[choice_id]
+            graded.append((question_id, choice_id, is_correct))
+            correct += is_correct
+        return graded, correct
+
+
+class QuizCache:
+    """Bounded LRU of compiled quizzes keyed by quiz id.
+
+    Lookups pass the version just read from the database; an entry built
+    from an older version is treated as a miss and replaced.
+    """
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._evictions = 0
+
+    def get(self, quiz_id, version):
+        with self._lock:
+            entry = self._entries.get(quiz_id)
+            if entry is None or entry.version != version:
+                self._misses += 1
+                if entry is not None:
+                    self._stale += 1
+                return None
+            self._entries.move_to_end(quiz_id)
+            self._hits += 1
+            return entry
+
+    def put(self, entry):
+        with self._lock:
+            self._entries[entry.quiz_id] = entry
+            self._entries.move_to_end(entry.quiz_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'stale': self._stale,
+                'evictions': self._evictions,
+                'hit_ratio': round(self._hits / lookups, 4) if lookups else 0
+            }
+
+
+def compile_quiz(quiz, content):
+    """Build a CompiledQuiz from a QUIZ_BY_* row and its QUIZ_CONTENT rows"""
+    quiz_id, lesson_id, title, passing_score, max_attempts = quiz[:5]
+    questions = []
+    answer_key = {}
+    for question_id, prompt, question_type, question_order, choice_id, text, choice_order, is_correct in content:
+        choices = answer_key.get(question_id)
+        if choices is None:
+            choices = answer_key[question_id] = {}
+            questions.append({
+                'id': question_id,
+                'prompt': prompt,
+                'type': question_type,
+                'order_index': question_order,
+                'choices': []
+            })
+        if choice_id is not None:
+            questions[-1]['choices'].append({'id': choice_id, 'text': text, 'order_index': choice_order})
+            choices[choice_id] = bool(is_correct)
+
+    payload = {
+        'id': quiz_id,
+        'title': title,
+        'passing_score': passing_score,
+        'max_attempts': max_attempts,
+        'questions': questions
+    }
+    return CompiledQuiz(quiz_id, lesson_id, tuple(quiz[5:]), payload, answer_key)
+
+
+def load_quiz(cache, query, key, db=None):
+    """Compiled quiz for a lesson or quiz id in at most two queries, or None.
+
+    One query reads the quiz row with its version; only on a cache miss
+    does a second read every question and choice in one join.
+    """
+    quizzes = load_quizzes(cache, query, (key,), db)
+    return quizzes[0] if quizzes else None
+
+
+def load_quizzes(cache, query, params, db=None, content=True):
+    """Compiled quizzes for every row `query` returns, in its order, in at most two queries"""
+    return quizzes_for_rows(cache, dal.fetch_rows(query, params, db), db, content)
+
+
+def quiz_version(row):
+    """(quiz id, version) of a QUIZ_BY_* row, enough for an ETag without loading content"""
+    return row[0], tuple(row[5:])
+
+
+def quizzes_for_rows(cache, rows, db=None, content=True):
+    """Compiled quizzes for QUIZ_BY_* rows already read, in their order.
+
+    Quizzes not cached at their current version have their questions and
+    choices read in one joined query for all of them. With content=False,
+    uncached quizzes come back with an empty answer key and no questions,
+    and are not cached.
+    """
+    quizzes = [cache.get(row[0], tuple(row[5:])) for row in rows]
+    missing = [row for row, quiz in zip(rows, quizzes) if quiz is None]
+    if not missing:
+        return quizzes
+    if not content:
+        compiled = {row[0]: compile_quiz(row, ()) for row in missing}
+        return [quiz or compiled[row[0]] for row, quiz in zip(rows, quizzes)]
+
+    if len(missing) == 1:
+        content_rows = [(missing[0][0],) + row for row in dal.fetch_rows(queries.QUIZ_CONTENT, (missing[0][0],), db)]
+    else:
+        content_rows = dal.fetch_rows(queries.quizzes_content(len(missing)), [row[0] for row in missing], db)
+    by_quiz = {}
+    for row in content_rows:
+        by_quiz.setdefault(row[0], []).append(row[1:])
+    compiled = {}
+    for row in missing:
+        compiled[row[0]] = compile_quiz(row, by_quiz.get(row[0], ()))
+        cache.put(compiled[row[0]])
+    return [quiz or compiled[row[0]] for row, quiz in zip(rows, quizzes)]
@@ -1,9 +1,15 @@
-from flask import Flask, request, jsonify
+from flask import Flask, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 from config import Config
-from database import get_db
-import jwt
+import database
+from database import get_db, pool, replicas, read_only, connection
+import dal
+from query_trace import tracer
+import queries
+from metrics import Metrics, stats_collector
+from compression import Compressor
+from auth_middleware import token_required, token_cache
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 
@@ -11,22 +17,44 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 app.config.from_object(Config)
+metrics = Metrics('report-service')
+metrics.init_app(app)
+compressor = Compressor.from_config(Config)
+compressor.init_app(app)
+database.init_app(app)
+tracer.init_app(app)
+metrics.register_collector(stats_collector('token_cache', token_cache.stats))
+metrics.register_collector(stats_collector('compression', compressor.route_stats, label='route'))
+metrics.register_collector(stats_collector('db_pool', pool.stats))
+metrics.register_collector(stats_collector('db_replica', replicas.replica_stats, label='replica'))
+metrics.register_collector(stats_collector('db_reads', replicas.routing_stats))
+metrics.register_collector(stats_collector('query', dal.query_stats.stats, label='query'))
+metrics.register_collector(stats_collector('query_trace', tracer.route_stats, label='route'))
 
 # Health check
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({'status': 'healthy', 'service': 'report-service'}), 200
 
+# Runtime stats
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'token_cache': token_cache.stats(),
+        'compression': compressor.stats(),
+        'db_pool': pool.stats(),
+        'db_replicas': replicas.replica_stats(),
+        'db_reads': replicas.routing_stats(),
+        'queries': dal.query_stats.stats(),
+        'query_trace': tracer.stats()
+    }), 200
+
 # Get weekly report for user
 @app.route('/reports/week', methods=['GET'])
-def get_weekly_report():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+@read_only
+def get_weekly_report(payload):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
         db = get_db()
         cursor = db.cursor()
         
@@ -66,8 +94,6 @@ def get_weekly_report():
             'quizzes_taken': quizzes_taken,
             'average_quiz_score': float(avg_score) if avg_score else 0
         }), 200
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -133,92 +159,66 @@ def generate_reports():
 
 # Get report history
 @app.route('/reports/history', methods=['GET'])
-def get_report_history():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    
-    if not token:
-        return jsonify({'error': 'No token provided'}), 401
-    
+@token_required
+@read_only
+def get_report_history(payload):
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        db = get_db()
-        cursor = db.cursor()
-        
-        cursor.execute(
-            '''SELECT id, report_date, lessons_completed, quizzes_taken, average_quiz_score, sent_at
-               FROM reports WHERE user_id = %s ORDER BY report_date DESC LIMIT 12''',
-            (payload['user_id'],)
-        )
-        reports = cursor.fetchall()
-        cursor.close()
-        
-        result = [
-            {
-                'id': r[0],
-                'report_date': str(r[1]),
-                'lessons_completed': r[2],
-                'quizzes_taken': r[3],
-                'average_quiz_score': float(r[4]) if r[4] else 0,
-                'sent_at': str(r[5]) if r[5] else None
-            } for r in reports
-        ]
+        result = dal.fetch_all(queries.REPORT_HISTORY, (payload['user_id'],))
         
         return jsonify(result), 200
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Background scheduler (runs weekly)
 def schedule_reports():
     """This would run weekly to generate reports automatically"""
-    db = get_db()
-    cursor = db.cursor()
+    with connection() as db:
+        cursor = db.cursor()
     
-    today = datetime.now().date()
-    week_ago = datetime.now() - timedelta(days=7)
+        today = datetime.now().date()
+        week_ago = datetime.now() - timedelta(days=7)
     
-    # Get all active users
-    cursor.execute('SELECT id FROM users WHERE active = TRUE')
-    users = cursor.fetchall()
+        # Get all active users
+        cursor.execute('SELECT id FROM users WHERE active = TRUE')
+        users = cursor.fetchall()
     
-    for user in users:
-        user_id = user[0]
+        for user in users:
+            user_id = user[0]
         
-        cursor.execute(
-            '''SELECT COUNT(*) FROM progress 
-               WHERE user_id = %s AND status = 'completed' AND completed_at >= %s''',
-            (user_id, week_ago)
-        )
-        lessons_completed = cursor.fetchone()[0]
+            cursor.execute(
+                '''SELECT COUNT(*) FROM progress 
+                   WHERE user_id = %s AND status = 'completed' AND completed_at >= %s''',
+                (user_id, week_ago)
+            )
+            lessons_completed = cursor.fetchone()[0]
         
-        cursor.execute(
-            '''SELECT COUNT(*) FROM quiz_attempts 
-               WHERE user_id = %s AND finished_at >= %s''',
-            (user_id, week_ago)
-        )
-        quizzes_taken = cursor.fetchone()[0]
+            cursor.execute(
+                '''SELECT COUNT(*) FROM quiz_attempts 
+                   WHERE user_id = %s AND finished_at >= %s''',
+                (user_id, week_ago)
+            )
+            quizzes_taken = cursor.fetchone()[0]
         
-        cursor.execute(
-            '''SELECT AVG(score) FROM quiz_attempts 
-               WHERE user_id = %s AND finished_at >= %s AND score IS NOT NULL''',
-            (user_id, week_ago)
-        )
-        avg_score = cursor.fetchone()[0]
+            cursor.execute(
+                '''SELECT AVG(score) FROM quiz_attempts 
+                   WHERE user_id = %s AND finished_at >= %s AND score IS NOT NULL''',
+                (user_id, week_ago)
+            )
+            avg_score = cursor.fetchone()[0]
         
-        cursor.execute(
-            '''INSERT INTO reports (user_id, report_date, lessons_completed, quizzes_taken, average_quiz_score, sent_at)
-               VALUES (%s, %s, %s, %s, %s, NOW())
-               ON DUPLICATE KEY UPDATE 
-               lessons_completed = VALUES(lessons_completed),
-               quizzes_taken = VALUES(quizzes_taken),
-               average_quiz_score = VALUES(average_quiz_score),
-               sent_at = NOW()''',
-            (user_id, today, lessons_completed, quizzes_taken, avg_score)
-        )
+            cursor.execute(
+                '''INSERT INTO reports (user_id, report_date, lessons_completed, quizzes_taken, average_quiz_score, sent_at)
+                   VALUES (%s, %s, %s, %s, %s, NOW())
+                   ON DUPLICATE KEY UPDATE 
+                   lessons_completed = VALUES(lessons_completed),
+                   quizzes_taken = VALUES(quizzes_taken),
+                   average_quiz_score = VALUES(average_quiz_score),
+                   sent_at = NOW()''',
+                (user_id, today, lessons_completed, quizzes_taken, avg_score)
+            )
     
-    db.commit()
-    cursor.close()
+        db.commit()
+        cursor.close()
 
 if __name__ == '__main__':
     # Optional: Start background scheduler
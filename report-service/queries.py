@@ -0,0 +1,9 @@
+from dal import Query, to_str, str_or_none, float_or_zero
+
+REPORT_HISTORY = Query(
+    'report_history',
+    '''SELECT id, report_date, lessons_completed, quizzes_taken, average_quiz_score, sent_at
+       FROM reports WHERE user_id = %s ORDER BY report_date DESC LIMIT 12''',
+    ('id', ('report_date', to_str), 'lessons_completed', 'quizzes_taken',
+     ('average_quiz_score', float_or_zero), ('sent_at', str_or_none))
+)